@@ -0,0 +1,183 @@
+"""
+A batch runner of plagiarism checks: jobs are read as JSON lines, results are written as JSON lines
+
+A job is a JSON object:
+    {"id": "any value", "original": "path", "suspicious": "path",
+     "mode": "diff", "threshold": 0.3, "alignment": null}
+Modes:
+    text – calculate_text_plagiarism_score of two texts tokenized by lines
+    diff – accumulate_diff_stats of two texts tokenized by lines
+    big – find_lcs_length_optimized of two big files tokenized with tokenize_big_file
+A result is written as soon as its job completes, so results may come in another order,
+"line" is a number of the job line
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+from time import perf_counter
+
+import main
+from instrumentation import PipelineStats
+from vocabulary import DEFAULT_VOCABULARY_PATH, get_vocabulary
+
+MODES = ('text', 'diff', 'big')
+
+# a number of tokenized files kept by each process
+TOKENIZATION_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=TOKENIZATION_CACHE_SIZE)
+def _tokenize_file(path: str, kind: str, vocabulary_path: str, modified: int, size: int):
+    if kind == 'big':
+        return main.tokenize_big_file(path, vocabulary=get_vocabulary(vocabulary_path))
+    with open(path, encoding='utf-8') as file:
+        return main.tokenize_by_lines(file.read())
+
+
+def tokenize_file(path: str, kind: str, vocabulary_path: str=DEFAULT_VOCABULARY_PATH):
+    """
+    Tokenizes a file once per process, a file changed since then is tokenized again
+    :param path: a path of the file
+    :param kind: 'big' for tokenize_big_file, anything else for tokenize_by_lines
+    :param vocabulary_path: a vocabulary file for 'big'
+    :return: tokens of the file
+    """
+    status = os.stat(path)
+    return _tokenize_file(path, 'big' if kind == 'big' else 'lines',
+                          vocabulary_path, status.st_mtime_ns, status.st_size)
+
+
+def run_job(line: int, job: dict) -> dict:
+    """
+    Runs one job, errors are reported in the result instead of being raised
+    :param line: a number of the job line
+    :param job: a parsed job
+    :return: a result with the score and timings in seconds
+    """
+    result = {'line': line, 'id': job.get('id') if isinstance(job, dict) else None}
+    start = perf_counter()
+    stats = PipelineStats()
+    try:
+        if not isinstance(job, dict):
+            raise ValueError(f'a job must be a JSON object: {job}')
+        mode = job.get('mode', 'diff')
+        if mode not in MODES:
+            raise ValueError(f'unknown mode {mode!r}')
+        threshold = float(job.get('threshold', 0.3))
+        if not 0 <= threshold <= 1:
+            raise ValueError(f'a threshold must be from 0 to 1: {threshold}')
+        result['mode'] = mode
+
+        with stats.stage('tokenization'):
+            vocabulary_path = job.get('vocabulary', DEFAULT_VOCABULARY_PATH)
+            original = tokenize_file(job['original'], mode, vocabulary_path)
+            suspicious = tokenize_file(job['suspicious'], mode, vocabulary_path)
+
+        if mode == 'big':
+            with stats.stage('lcs_length'):
+                lcs_length = main.find_lcs_length_optimized(original, suspicious, threshold)
+            result['lcs_length'] = lcs_length
+            result['score'] = lcs_length / len(suspicious) if suspicious else 0.0
+        elif mode == 'text':
+            result['score'] = main.calculate_text_plagiarism_score(
+                original, suspicious, threshold,
+                alignment=job.get('alignment'), stats=stats)
+        else:
+            diff_stats = main.accumulate_diff_stats(
+                original, suspicious, threshold,
+                alignment=job.get('alignment'), stats=stats)
+            # a text without tokens gives empty statistics, as it scores 0 in text mode
+            result['score'] = diff_stats.get('text_plagiarism', 0.0)
+            result['sentence_plagiarism'] = diff_stats.get('sentence_plagiarism', [])
+            result['sentence_lcs_length'] = diff_stats.get('sentence_lcs_length', [])
+    except (KeyError, OSError, TypeError, ValueError) as error:
+        result['error'] = f'{type(error).__name__}: {error}'
+    result['timings'] = dict(stats.timers, total=perf_counter() - start)
+    return result
+
+
+def read_jobs(lines):
+    """
+    Parses job lines lazily, blank lines are skipped
+    :param lines: an iterable of strings
+    :return: a generator of (line number, job), instead of a job which is not valid JSON
+    the text of the error is yielded
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as error:
+            yield number, f'{error}'
+
+
+def run_jobs(jobs, workers: int=1, max_pending: int=None):
+    """
+    Runs jobs on a process pool and yields results as they complete
+    At most max_pending jobs are submitted at once, the next job is read
+    only when a result is taken, so the job stream is never loaded into memory
+    :param jobs: an iterable of (line number, job)
+    :param workers: a number of processes, 1 runs the jobs in the current process
+    :param max_pending: a number of submitted jobs, twice the number of workers by default
+    :return: a generator of results
+    """
+    if workers == 1:
+        yield from (run_job(line, job) for line, job in jobs)
+        return
+
+    max_pending = max_pending or 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for line, job in jobs:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in done)
+            pending.add(pool.submit(run_job, line, job))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from (future.result() for future in done)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('jobs', nargs='?', default='-',
+                        help='a JSON lines file with jobs, - for stdin')
+    parser.add_argument('-o', '--output', default='-',
+                        help='a JSON lines file for results, - for stdout')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='a number of processes, 0 uses all cores')
+    parser.add_argument('--max-pending', type=int,
+                        help='a number of jobs submitted to the pool at once')
+    return parser.parse_args(argv)
+
+
+def run(argv=None) -> int:
+    """
+    Runs the jobs from the command line
+    :return: an exit code, 1 when any job failed
+    """
+    args = parse_args(argv)
+    jobs_file = sys.stdin if args.jobs == '-' else open(args.jobs, encoding='utf-8')
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    failed = False
+    try:
+        for result in run_jobs(read_jobs(jobs_file), args.workers or None, args.max_pending):
+            failed = failed or 'error' in result
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+    finally:
+        if jobs_file is not sys.stdin:
+            jobs_file.close()
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
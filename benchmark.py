@@ -0,0 +1,246 @@
+"""
+Benchmarks of the longest common subsequence implementation on synthetic corpora
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import main
+from pair_cache import SentencePairCache
+from vocabulary import VocabularyStore
+
+SIZES = (10, 100, 1000)
+QUICK_SIZES = (10, 100)
+
+
+def synthetic_word(idx: int) -> str:
+    """
+    Spells a number with lowercase letters, so every word is one token of the tokenizers
+    :param idx: a non-negative number
+    :return: a word, different numbers give different words
+    """
+    letters = ['w']
+    while True:
+        idx, letter = divmod(idx, 26)
+        letters.append(chr(ord('a') + letter))
+        if not idx:
+            return ''.join(letters)
+
+
+def generate_sentence(generator: random.Random, words: list, weights: list,
+                      sentence_length: int) -> list:
+    """
+    Generates a sentence of Zipf-distributed words
+    :param generator: a seeded random generator
+    :param words: a vocabulary
+    :param weights: weights of the words
+    :param sentence_length: an average number of words
+    :return: a list of words
+    """
+    length = max(1, round(generator.gauss(sentence_length, sentence_length / 4)))
+    return generator.choices(words, weights, k=length)
+
+
+def generate_texts(seed: int, sentences: int, sentence_length: int=12,
+                   vocabulary_size: int=2000, overlap: float=0.5) -> tuple:
+    """
+    Generates a reproducible pair of texts
+    A share of suspicious sentences equal to overlap is copied from the original
+    with a few words replaced, the rest is generated anew
+    :param seed: a seed of the random generator
+    :param sentences: a number of sentences in each text
+    :param sentence_length: an average number of words in a sentence
+    :param vocabulary_size: a number of distinct words
+    :param overlap: a share of copied sentences, from 0 to 1
+    :return: the original text and the suspicious text
+    """
+    generator = random.Random(seed)
+    words = [synthetic_word(idx) for idx in range(vocabulary_size)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+
+    original = [generate_sentence(generator, words, weights, sentence_length)
+                for _ in range(sentences)]
+    suspicious = []
+    for sentence in original:
+        if generator.random() < overlap:
+            copy = list(sentence)
+            for _ in range(max(1, len(copy) // 5)):
+                copy[generator.randrange(len(copy))] = generator.choice(words)
+            suspicious.append(copy)
+        else:
+            suspicious.append(generate_sentence(generator, words, weights, sentence_length))
+
+    return ('\n'.join(map(' '.join, original)),
+            '\n'.join(map(' '.join, suspicious)))
+
+
+def measure(func, repeat: int) -> dict:
+    """
+    Measures the best time of several runs and the peak memory of one more run
+    :param func: a function without arguments
+    :param repeat: a number of timed runs
+    :return: a dictionary with seconds and peak_bytes
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def run_benchmarks(sizes=SIZES, repeat: int=3, seed: int=0,
+                   sentence_length: int=12, vocabulary_size: int=2000,
+                   overlap: float=0.5) -> dict:
+    """
+    Times the main functions on synthetic texts of growing size
+    :param sizes: numbers of sentences in a text
+    :param repeat: a number of timed runs of each case
+    :param seed: a seed of the corpora
+    :param sentence_length: an average number of words in a sentence
+    :param vocabulary_size: a number of distinct words
+    :param overlap: a share of copied sentences
+    :return: a dictionary case name -> measurements
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            original_text, suspicious_text = generate_texts(seed, size, sentence_length,
+                                                            vocabulary_size, overlap)
+            original_path = os.path.join(directory, f'original_{size}.txt')
+            with open(original_path, 'w', encoding='utf-8') as file:
+                file.write(original_text)
+
+            original_tokens = main.tokenize_by_lines(original_text)
+            suspicious_tokens = main.tokenize_by_lines(suspicious_text)
+            original_flat = sum(original_tokens, ())
+            suspicious_flat = sum(suspicious_tokens, ())
+            # the quadratic matrix functions get one sentence of size * 2 tokens
+            first_sentence = original_flat[:size * 2]
+            second_sentence = suspicious_flat[:size * 2]
+            matrix = main.fill_lcs_matrix(first_sentence, second_sentence)
+            # without a cache every run computes all pairs, not only the first one
+            no_cache = SentencePairCache(0)
+            stats = main.accumulate_diff_stats(original_tokens, suspicious_tokens, cache=no_cache)
+
+            def tokenize_big_file():
+                vocabulary = VocabularyStore(os.path.join(directory, 'vocabulary.txt'))
+                main.tokenize_big_file(original_path, vocabulary=vocabulary)
+
+            cases = {
+                'tokenize_by_lines': lambda: main.tokenize_by_lines(original_text),
+                'tokenize_big_file': tokenize_big_file,
+                'fill_lcs_matrix': lambda: main.fill_lcs_matrix(first_sentence,
+                                                                second_sentence),
+                'find_lcs': lambda: main.find_lcs(first_sentence, second_sentence, matrix),
+                'find_lcs_length_optimized':
+                    lambda: main.find_lcs_length_optimized(original_flat, suspicious_flat, 0.0),
+                'accumulate_diff_stats':
+                    lambda: main.accumulate_diff_stats(original_tokens, suspicious_tokens,
+                                                       cache=no_cache),
+                'create_diff_report':
+                    lambda: main.create_diff_report(original_tokens, suspicious_tokens, stats),
+            }
+            for name, func in cases.items():
+                results[f'{name}[{size}]'] = measure(func, repeat)
+    return results
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Finds cases which became slower or use more memory than in the baseline
+    :param results: current measurements
+    :param baseline: stored measurements
+    :param tolerance: an allowed relative growth, e.g. 0.2 for 20%
+    :return: a list of descriptions of regressions
+    """
+    regressions = []
+    for case, current in results.items():
+        previous = baseline.get(case)
+        if previous is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f'{case}: {metric} {previous[metric]:.6g} -> '
+                                   f'{current[metric]:.6g}')
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='a JSON file for the results')
+    parser.add_argument('--baseline',
+                        help='a JSON file with stored results to compare with')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write the results to the --baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='an allowed relative growth of time and memory')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help='numbers of sentences in a text')
+    parser.add_argument('--quick', action='store_true', help='only small sizes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sentence-length', type=int, default=12)
+    parser.add_argument('--vocabulary-size', type=int, default=2000)
+    parser.add_argument('--overlap', type=float, default=0.5)
+    args = parser.parse_args(argv)
+    if args.save_baseline and not args.baseline:
+        parser.error('--save-baseline needs a --baseline file to write')
+    return args
+
+
+def run(argv=None) -> int:
+    """
+    Runs the benchmarks from the command line
+    :return: an exit code, 1 when a regression is found
+    """
+    args = parse_args(argv)
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    results = run_benchmarks(sizes, args.repeat, args.seed, args.sentence_length,
+                             args.vocabulary_size, args.overlap)
+    report = {'meta': {'python': sys.version.split()[0],
+                       'platform': platform.platform(),
+                       'sizes': list(sizes),
+                       'seed': args.seed,
+                       'sentence_length': args.sentence_length,
+                       'vocabulary_size': args.vocabulary_size,
+                       'overlap': args.overlap},
+              'results': results}
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    for case, measurement in results.items():
+        print(f'{case:40} {measurement["seconds"]:12.6f} s '
+              f'{measurement["peak_bytes"] / 1024:12.1f} KiB')
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        return 0
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)['results']
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
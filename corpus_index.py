@@ -0,0 +1,177 @@
+"""
+A candidate-filtering index of original texts for lab_2
+"""
+
+import pickle
+import random
+import zlib
+from collections import Counter, defaultdict
+
+import main
+
+# a Mersenne prime for the universal hash functions of MinHash
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def as_sentences(text_tokens) -> tuple:
+    """
+    Brings tokenize_by_lines and tokenize_big_file output to one form
+    :param text_tokens: a tuple of sentences with tokens or a flat sequence of ids
+    :return: a tuple of sentences, a flat sequence becomes one sentence
+    """
+    if text_tokens and all(isinstance(sentence, (tuple, list)) for sentence in text_tokens):
+        return tuple(tuple(sentence) for sentence in text_tokens)
+    return (tuple(text_tokens),)
+
+
+def sentence_shingles(sentence_tokens: tuple, shingle_size: int) -> set:
+    """
+    Hashes token n-grams of a sentence with a hash that does not change between runs,
+    a sentence shorter than n is one shingle
+    :param sentence_tokens: a tuple of tokens or ids
+    :param shingle_size: a number of tokens in a shingle
+    :return: a set of shingle hashes
+    """
+    count = max(len(sentence_tokens) - shingle_size + 1, 1)
+    return {zlib.crc32('\x1f'.join(map(str, sentence_tokens[i:i + shingle_size])).encode())
+            for i in range(count)} if sentence_tokens else set()
+
+
+class CorpusIndex:
+    """
+    Finds candidate originals for a suspicious text without lcs:
+    documents are compared by MinHash signatures of their shingles, bucketed with LSH bands,
+    sentences are matched through an inverted index of shingles
+    The index is updated with add_document and kept on disk with save and load
+    """
+
+    def __init__(self, shingle_size: int=3, num_hashes: int=64, bands: int=32, seed: int=0):
+        if num_hashes % bands:
+            raise ValueError('num_hashes must be divisible by bands')
+        self.shingle_size = shingle_size
+        self.bands = bands
+        generator = random.Random(seed)
+        self.hash_params = tuple((generator.randrange(1, MERSENNE_PRIME),
+                                  generator.randrange(MERSENNE_PRIME))
+                                 for _ in range(num_hashes))
+        self.signatures = {}
+        self.buckets = [defaultdict(set) for _ in range(bands)]
+        self.postings = defaultdict(list)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.signatures
+
+    def signature(self, shingles: set) -> tuple:
+        """
+        Computes a MinHash signature of a set of shingles
+        :param shingles: a set of shingle hashes
+        :return: a tuple with one minimum per hash function
+        """
+        if not shingles:
+            return (MERSENNE_PRIME,) * len(self.hash_params)
+        return tuple(min((a * shingle + b) % MERSENNE_PRIME for shingle in shingles)
+                     for a, b in self.hash_params)
+
+    def _band_keys(self, signature: tuple):
+        rows = len(signature) // self.bands
+        for band in range(self.bands):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    def _text_shingles(self, sentences: tuple) -> list:
+        return [sentence_shingles(sentence, self.shingle_size) for sentence in sentences]
+
+    def add_document(self, doc_id, text_tokens) -> None:
+        """
+        Adds an original text to the index
+        :param doc_id: a hashable identifier of the document, e.g. its path
+        :param text_tokens: a tuple of sentences with tokens or a flat sequence of ids
+        """
+        if doc_id in self.signatures:
+            raise ValueError(f'document {doc_id!r} is already indexed')
+
+        shingles = self._text_shingles(as_sentences(text_tokens))
+        for sentence_idx, sentence in enumerate(shingles):
+            for shingle in sentence:
+                self.postings[shingle].append((doc_id, sentence_idx))
+
+        signature = self.signature(set().union(*shingles))
+        self.signatures[doc_id] = signature
+        for band, key in self._band_keys(signature):
+            self.buckets[band][key].add(doc_id)
+
+    def find_candidates(self, text_tokens, top: int=10) -> list:
+        """
+        Ranks indexed documents which share at least one LSH band with the text
+        :param text_tokens: a tuple of sentences with tokens or a flat sequence of ids
+        :param top: a maximum number of candidates
+        :return: a list of (doc_id, estimated Jaccard similarity), the most similar first
+        """
+        shingles = set().union(*self._text_shingles(as_sentences(text_tokens)))
+        signature = self.signature(shingles)
+
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(key, ()))
+
+        similarity = {doc_id: sum(x == y for x, y in zip(signature, self.signatures[doc_id])) /
+                              len(signature)
+                      for doc_id in candidates}
+        return sorted(similarity.items(), key=lambda item: -item[1])[:top]
+
+    def find_sentence_candidates(self, text_tokens, top: int=3) -> list:
+        """
+        Finds original sentences sharing shingles with each sentence of the text
+        :param text_tokens: a tuple of sentences with tokens or a flat sequence of ids
+        :param top: a maximum number of candidates for one sentence
+        :return: a list of (sentence index, doc_id, original sentence index, shared shingles),
+        sorted by the sentence index and then by the number of shared shingles
+        """
+        pairs = []
+        for sentence_idx, shingles in enumerate(self._text_shingles(as_sentences(text_tokens))):
+            shared = Counter(posting for shingle in shingles
+                             for posting in self.postings.get(shingle, ()))
+            pairs.extend((sentence_idx, doc_id, orig_idx, count)
+                         for (doc_id, orig_idx), count in shared.most_common(top))
+        return pairs
+
+    def save(self, path: str) -> None:
+        """
+        Writes the index to disk
+        :param path: a path of the index file
+        """
+        with open(path, 'wb') as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: str) -> 'CorpusIndex':
+        """
+        Reads an index written with save
+        :param path: a path of the index file
+        :return: the index, documents can still be added to it
+        """
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+def check_against_corpus(index: CorpusIndex,
+                         originals,
+                         suspicious_text_tokens: tuple,
+                         top: int=10,
+                         plagiarism_threshold: float=0.3) -> list:
+    """
+    Scores a suspicious text with lcs only against the shortlist of the index
+    :param index: a corpus index of the originals
+    :param originals: a mapping doc_id -> a tuple of sentences with tokens
+    :param suspicious_text_tokens: a tuple of sentences with tokens
+    :param top: a size of the shortlist
+    :param plagiarism_threshold: a threshold
+    :return: a list of (doc_id, text plagiarism score), the highest score first
+    """
+    scores = [(doc_id, main.calculate_text_plagiarism_score(originals[doc_id],
+                                                            suspicious_text_tokens,
+                                                            plagiarism_threshold))
+              for doc_id, _ in index.find_candidates(suspicious_text_tokens, top)]
+    return sorted(scores, key=lambda item: -item[1])
@@ -0,0 +1,172 @@
+"""
+Comparison of every document of one corpus with every document of another for lab_2
+"""
+
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import instrumentation
+import main
+from pair_cache import pair_key
+
+# a number of unique sentence pairs scored between two checkpoints
+CHECKPOINT_PAIRS = 10_000
+
+MATRIX_FORMS = ('dense', 'sparse')
+
+
+def tokenize_documents(documents) -> tuple:
+    """
+    Tokenizes each document once
+    :param documents: an iterable of texts or of tuples of sentences with tokens
+    :return: a tuple of tuples of sentences with tokens
+    """
+    return tuple(main.tokenize_by_lines(document) if isinstance(document, str) else document
+                 for document in documents)
+
+
+def load_checkpoint(path: str, plagiarism_threshold: float) -> dict:
+    """
+    Reads scores saved by an interrupted run with the same threshold
+    The checkpoint is a log: the threshold, then one record per batch of scored pairs,
+    a record cut short by the interruption is dropped
+    :param path: a path of the checkpoint file or None
+    :param plagiarism_threshold: a threshold of the current run
+    :return: a dictionary pair_key -> score, empty if nothing can be reused
+    """
+    if path is None or not os.path.exists(path):
+        return {}
+    scores = {}
+    with open(path, 'rb') as file:
+        try:
+            if pickle.load(file) != plagiarism_threshold:
+                return {}
+            while True:
+                scores.update(pickle.load(file))
+        except (EOFError, pickle.UnpicklingError):
+            pass
+    return scores
+
+
+def start_checkpoint(path: str, plagiarism_threshold: float, scores: dict) -> None:
+    """
+    Starts the checkpoint log of a run with the scores it reuses, once per run,
+    a reader never sees a partly written file
+    :param path: a path of the checkpoint file
+    :param plagiarism_threshold: a threshold the scores are computed with
+    :param scores: a dictionary pair_key -> score read by load_checkpoint
+    """
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'wb') as file:
+        pickle.dump(plagiarism_threshold, file, protocol=pickle.HIGHEST_PROTOCOL)
+        if scores:
+            pickle.dump(scores, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+
+def append_checkpoint(path: str, scores: dict) -> None:
+    """
+    Appends a batch of scores to the checkpoint log, the scores written before
+    are not written again
+    :param path: a path of the checkpoint file started with start_checkpoint
+    :param scores: a dictionary pair_key -> score of the batch
+    """
+    with open(path, 'ab') as file:
+        pickle.dump(scores, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def compare_corpora(originals,
+                    suspicious=None,
+                    plagiarism_threshold: float=0.3,
+                    *,
+                    form: str='dense',
+                    workers: int=1,
+                    chunk_size: int=256,
+                    checkpoint: str=None,
+                    checkpoint_pairs: int=CHECKPOINT_PAIRS) -> list:
+    """
+    Calculates calculate_text_plagiarism_score for every original and every suspicious document
+    Documents are tokenized once, identical sentences are found across all documents,
+    and each unique pair of sentences is scored once, on a process pool if workers > 1
+    Scores of sentence pairs are appended to the checkpoint file every checkpoint_pairs pairs,
+    so a rerun after an interruption scores only the pairs left
+    :param originals: a sequence of texts or of tuples of sentences with tokens
+    :param suspicious: the same for suspicious documents, None compares originals with themselves
+    :param plagiarism_threshold: a threshold
+    :param form: 'dense' gives a list of N rows with M scores,
+    'sparse' gives a list of N dictionaries suspicious index -> score for scores above 0
+    :param workers: a number of processes, 1 means no process pool, None uses all cores
+    :param chunk_size: a number of sentence pairs sent to a process at once
+    :param checkpoint: a path of the checkpoint file or None
+    :param checkpoint_pairs: a number of pairs scored between two checkpoints
+    :return: the score matrix, row i is for original i, column j – for suspicious document j
+    """
+    if form not in MATRIX_FORMS:
+        raise ValueError(f'unknown matrix form {form!r}')
+
+    originals = tokenize_documents(originals)
+    suspicious = originals if suspicious is None else tokenize_documents(suspicious)
+
+    sentence_ids = {}
+
+    def encode(document):
+        return tuple(sentence_ids.setdefault(sentence, len(sentence_ids))
+                     for sentence in document)
+
+    original_ids = [encode(document) for document in originals]
+    suspicious_ids = original_ids if suspicious is originals else \
+                     [encode(document) for document in suspicious]
+    sentences = list(sentence_ids)
+
+    # sentence i of a suspicious document is compared with sentence i of an original one
+    unique_pairs = set()
+    for original in original_ids:
+        for document in suspicious_ids:
+            unique_pairs.update(zip(original, document))
+    keys = {pair: pair_key(sentences[pair[0]], sentences[pair[1]]) for pair in unique_pairs}
+    if (stats := instrumentation.ACTIVE.get()) is not None:
+        stats.count('sentence_pairs', sum(min(len(original), len(document))
+                                          for original in original_ids
+                                          for document in suspicious_ids))
+        stats.count('unique_sentence_pairs', len(unique_pairs))
+
+    scores = load_checkpoint(checkpoint, plagiarism_threshold)
+    to_score = sorted(pair for pair in unique_pairs if keys[pair] not in scores)
+    batch_size = checkpoint_pairs if checkpoint is not None else len(to_score)
+    if checkpoint is not None:
+        start_checkpoint(checkpoint, plagiarism_threshold, scores)
+    # one pool serves all batches
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 and to_score else None
+    try:
+        for start in range(0, len(to_score), batch_size or 1):
+            batch = to_score[start:start + batch_size]
+            computed = main.map_sentence_pairs(main.score_sentence_pair,
+                                               [sentences[orig_id] for orig_id, _ in batch],
+                                               [sentences[susp_id] for _, susp_id in batch],
+                                               repeat(plagiarism_threshold),
+                                               workers=workers,
+                                               chunk_size=chunk_size,
+                                               pool=pool)
+            batch_scores = dict(zip((keys[pair] for pair in batch), computed))
+            scores.update(batch_scores)
+            if checkpoint is not None:
+                append_checkpoint(checkpoint, batch_scores)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    matrix = []
+    for original in original_ids:
+        row = []
+        for document in suspicious_ids:
+            if not original or not document:
+                row.append(0.0)
+                continue
+            pair_scores = (scores[keys[pair]] for pair in zip(original, document))
+            # sentences without a pair score -1 in calculate_text_plagiarism_score
+            row.append(sum(score for score in pair_scores if score >= 0) / len(document))
+        matrix.append(row if form == 'dense' else
+                      {susp_idx: score for susp_idx, score in enumerate(row) if score > 0})
+    return matrix
@@ -2,54 +2,88 @@
 A module of decorators for checking in lab_2
 """
 
+from functools import wraps
+
+import instrumentation
+
+
 def none_check(arg, return_value):
-    flattened = []
-    to_check = [*arg]
+    """
+    Scans a nested structure once, depth first, and stops at the first None
+    Strings are not expanded, other iterables are
+    :param arg: a sequence to check
+    :param return_value: a value to return when None is found
+    :return: return_value if any nested item is None, 1 otherwise
+    """
+    to_check = [arg]
     while to_check:
-        for value in to_check[:]:
-            if isinstance(value, str):
-                flattened.append(value)
-            else:
-                try:
-                    to_check.extend([*value])
-                except TypeError:
-                    flattened.append(value)
-            to_check.remove(value)
-
-    if any(item is None for item in flattened):
-        return return_value
+        value = to_check.pop()
+        if value is None:
+            return return_value
+        if isinstance(value, str):
+            continue
+        if isinstance(value, (tuple, list)):
+            to_check.extend(value)
+            continue
+        try:
+            to_check.extend(iter(value))
+        except TypeError:
+            pass
     return 1
 
 
 def input_checker(func):
-    def wrapper(*args, **kwargs):
-        if func.__annotations__['return'] == int:
-            return_value = -1
-        elif func.__annotations__['return'] == float:
-            return_value = -1.0
-        else:
-            return_value =  func.__annotations__['return']()
+    """
+    Validates positional arguments against the annotations of func
+    Annotations are resolved once, when func is decorated
+    The undecorated function is available as wrapper.unchecked
+    for internal calls on data that is already validated
+    While instrumentation is on, the checks are timed as the 'validation' stage
+    """
+    annotations = dict(func.__annotations__)
+    return_type = annotations.pop('return')
+    instances = tuple(annotations.values())
 
-        for arg, instance in zip(args, func.__annotations__.values()):
+    def invalid():
+        if return_type == int:
+            return -1
+        if return_type == float:
+            return -1.0
+        return return_type()
+
+    def validate(args):
+        for arg, instance in zip(args, instances):
             # if type doesn't match
             if not isinstance(arg, instance):
-                return return_value
+                return invalid()
 
             # if int or float value is non-valid
             if instance == int and (isinstance(arg, bool) or arg < 0):
-                return return_value
+                return invalid()
             if instance == float and (arg < 0 or arg > 1):
-                return return_value
+                return invalid()
 
-            # if sequence is empty
-            if isinstance(arg, (tuple, list)) and not arg:
-                return func.__annotations__['return']()
+            if isinstance(arg, (tuple, list, memoryview)):
+                # if sequence is empty
+                if not arg:
+                    return return_type()
 
-            # if any is None
-            if isinstance(arg, (tuple, list)):
-                res = none_check(arg, return_value)
-                if res == return_value:
-                    return return_value
+                # if any is None, a memoryview holds numbers only
+                if not isinstance(arg, memoryview) and none_check(arg, None) is None:
+                    return invalid()
+        return None
 
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = instrumentation.ACTIVE.get()
+        if stats is None:
+            rejected = validate(args)
+        else:
+            with stats.stage('validation'):
+                rejected = validate(args)
+        if rejected is not None:
+            return rejected
         return func(*args, **kwargs)
+
+    wrapper.unchecked = func
     return wrapper
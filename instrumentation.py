@@ -0,0 +1,118 @@
+"""
+Optional instrumentation of lab_2: stage timers, counters and hooks
+"""
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+# the stats collecting at the moment, None while instrumentation is off,
+# a context variable, so threads and asyncio tasks serving other requests do not share it
+ACTIVE = ContextVar('pipeline_stats', default=None)
+
+
+class PipelineStats:
+    """
+    Collects where time goes in a plagiarism check
+    timers: stage -> seconds, stages nest, so a stage includes the time of its inner stages
+    calls: stage -> a number of runs
+    counters: event -> a count, e.g. dp_cells, pairs_pruned
+    peaks: name -> the largest value recorded, e.g. matrix_cells
+    Each hook is called as hook(kind, name, value) on every record,
+    kind is 'stage', 'count' or 'peak'
+    Work done in worker processes is not collected
+    """
+
+    def __init__(self, hooks=()):
+        self.timers = defaultdict(float)
+        self.calls = Counter()
+        self.counters = Counter()
+        self.peaks = {}
+        self.hooks = list(hooks)
+
+    def _notify(self, kind: str, name: str, value) -> None:
+        for hook in self.hooks:
+            hook(kind, name, value)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times the body of a with statement
+        :param name: a name of the stage
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.timers[name] += elapsed
+            self.calls[name] += 1
+            if self.hooks:
+                self._notify('stage', name, elapsed)
+
+    def count(self, name: str, value: int=1) -> None:
+        """
+        Increases a counter
+        :param name: a name of the counter
+        :param value: an increment
+        """
+        self.counters[name] += value
+        if self.hooks:
+            self._notify('count', name, value)
+
+    def peak(self, name: str, value) -> None:
+        """
+        Keeps the largest of the recorded values
+        :param name: a name of the value
+        :param value: a recorded value
+        """
+        if value > self.peaks.get(name, value - 1):
+            self.peaks[name] = value
+        if self.hooks:
+            self._notify('peak', name, value)
+
+    def as_dict(self) -> dict:
+        """
+        :return: the collected statistics as plain dictionaries, e.g. for json
+        """
+        return {'timers': dict(self.timers),
+                'calls': dict(self.calls),
+                'counters': dict(self.counters),
+                'peaks': dict(self.peaks)}
+
+
+@contextmanager
+def collecting(stats: PipelineStats):
+    """
+    Turns instrumentation on for the body of a with statement, in the current context only
+    :param stats: stats to collect into, None keeps the current state
+    :return: the stats
+    """
+    if stats is None:
+        yield ACTIVE.get()
+        return
+    token = ACTIVE.set(stats)
+    try:
+        yield stats
+    finally:
+        ACTIVE.reset(token)
+
+
+def timed(name: str):
+    """
+    Makes a decorator which times every call of a function as a stage
+    While instrumentation is off, a call costs one more function call and one check
+    :param name: a name of the stage
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            stats = ACTIVE.get()
+            if stats is None:
+                return func(*args, **kwargs)
+            with stats.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,694 @@
+"""
+Engines for the longest common subsequence problem used by lab_2
+"""
+
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from collections.abc import Sequence
+from itertools import accumulate, compress
+from operator import eq
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# maps the characters of a binary string to 1 for a zero bit and 0 for a one bit
+ZERO_BITS = bytes.maketrans(b'01', b'\x01\x00')
+
+# blocks with fewer cells are solved with a plain matrix in hirschberg_lcs
+SMALL_BLOCK_CELLS = 1024
+
+# costs relative to one step of bit_parallel_lcs_length on a single machine word,
+# auto_lcs_length uses them to choose an engine
+BIT_PARALLEL_WORD_COST = 0.03
+SPARSE_TOKEN_COST = 1.5
+SPARSE_MATCH_COST = 1.6
+
+# bit_parallel_lcs_length checks whether min_length is reachable every this many steps
+EARLY_EXIT_STEPS = 32
+
+# widths of fields of PackedSentenceBlock and array typecodes to read them,
+# a packed sentence must be shorter than its field
+FIELD_TYPECODES = {16: 'H', 32: 'I', 64: 'Q'}
+FIELD_BITS = max(FIELD_TYPECODES)
+
+# shorter sequences are always solved bit-parallel, their vectors fit in a few words
+SPARSE_MIN_LENGTH = 1024
+
+# split_lcs_problem solves sub-problems with fewer cells exactly, without anchors
+ANCHOR_EXACT_CELLS = 1 << 22
+
+# lengths of n-grams split_lcs_problem tries as anchors, one after another:
+# a long n-gram found once in each sequence rarely matches by chance, a single token often does
+ANCHOR_NGRAMS = (8, 4, 1)
+
+# split_lcs_problem cuts at anchors only when they cover this share of the shorter part:
+# scattered chance matches of unrelated texts would cut away most of their lcs
+ANCHOR_MIN_COVERAGE = 0.2
+
+# parts with more cells are cut at any anchors, they are too large to be solved exactly
+ANCHOR_MAX_EXACT_CELLS = 1 << 34
+
+
+def build_match_masks(tokens) -> dict:
+    """
+    Builds bit masks of token positions: bit i of mask[token] is set
+    when tokens[i] == token
+    :param tokens: a sequence of hashable tokens (strings or ids)
+    :return: a dictionary token -> bit mask
+    e.g. tokens = ('a', 'b', 'a')
+    --> {'a': 0b101, 'b': 0b010}
+    """
+    masks = {}
+    bit = 1
+    for token in tokens:
+        masks[token] = masks.get(token, 0) | bit
+        bit <<= 1
+    return masks
+
+
+def bit_parallel_lcs_vector(first_tokens, second_tokens, masks: dict=None) -> int:
+    """
+    Runs the bit-parallel LCS recurrence (Allison–Dix, Hyyrö)
+    over the positions of the first sequence, one step per token of the second one
+    A zero bit i in the result marks a match at first_tokens[i]
+    :param first_tokens: a sequence of tokens, its positions are the bits of the vector
+    :param second_tokens: a sequence of tokens
+    :param masks: precomputed match masks of the first sequence
+    :return: a bit vector, the lcs length is the number of its zero bits
+    """
+    if masks is None:
+        masks = build_match_masks(first_tokens)
+    full = (1 << len(first_tokens)) - 1
+    vector = full
+    for token in second_tokens:
+        match = masks.get(token)
+        if match:
+            common = vector & match
+            vector = ((vector + common) | (vector - common)) & full
+    return vector
+
+
+def bit_parallel_lcs_length(first_tokens, second_tokens, min_length: int=0) -> int:
+    """
+    Finds a length of the longest common subsequence
+    using Python big ints as bit vectors
+    The cost is O(n * m / w) where w is a machine word
+    Every EARLY_EXIT_STEPS steps the length found so far plus the remaining steps
+    is compared with min_length, and the computation stops when it cannot be reached
+    :param first_tokens: a sequence of tokens (strings or ids)
+    :param second_tokens: a sequence of tokens (strings or ids)
+    :param min_length: a length the caller is interested in
+    :return: a length of the longest common subsequence,
+    or any smaller value when it is less than min_length
+    """
+    if len(first_tokens) < len(second_tokens):
+        first_tokens, second_tokens = second_tokens, first_tokens
+    if not second_tokens:
+        return 0
+
+    masks = build_match_masks(first_tokens)
+    length = len(first_tokens)
+    full = (1 << length) - 1
+    vector = full
+    for step, token in enumerate(second_tokens, 1):
+        match = masks.get(token)
+        if match:
+            common = vector & match
+            vector = ((vector + common) | (vector - common)) & full
+        if min_length and not step % EARLY_EXIT_STEPS:
+            found = length - bin(vector).count('1')
+            if found + len(second_tokens) - step < min_length:
+                return found
+    return length - bin(vector).count('1')
+
+
+def lcs_upper_bound(first_tokens, second_tokens) -> int:
+    """
+    Finds a cheap upper bound of the lcs length:
+    a number of tokens of the shorter sequence which occur in the longer one
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :return: a number no less than the lcs length
+    """
+    if len(first_tokens) > len(second_tokens):
+        first_tokens, second_tokens = second_tokens, first_tokens
+    return sum(map(set(second_tokens).__contains__, first_tokens))
+
+
+def runs_equal(first_run, second_run) -> bool:
+    """
+    Compares two slices of the same length by their tokens, slices of different
+    sequence types (a tuple and an array, a list and a memoryview) are never equal
+    with ==, so they are compared token by token
+    :param first_run: a slice of a sequence of tokens
+    :param second_run: a slice of a sequence of tokens
+    :return: True if the tokens are equal
+    """
+    if type(first_run) is type(second_run):
+        return first_run == second_run
+    return all(map(eq, first_run, second_run))
+
+
+def common_run_length(first_tokens, second_tokens, first_start: int, second_start: int,
+                      limit: int=None) -> int:
+    """
+    Finds how many tokens coincide starting from the given positions,
+    slices of growing length are compared at C speed, the sequences may be of different types
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :param first_start: a position in the first sequence
+    :param second_start: a position in the second sequence
+    :param limit: a maximum length of the run
+    :return: a length of the common run
+    """
+    if limit is None:
+        limit = min(len(first_tokens) - first_start, len(second_tokens) - second_start)
+    run = 0
+    step = 8
+    while True:
+        size = min(step, limit - run)
+        if size <= 0:
+            return run
+        if not runs_equal(first_tokens[first_start + run:first_start + run + size],
+                          second_tokens[second_start + run:second_start + run + size]):
+            break
+        run += size
+        step *= 2
+    while run < limit and first_tokens[first_start + run] == second_tokens[second_start + run]:
+        run += 1
+    return run
+
+
+def banded_lcs_length(first_tokens, second_tokens, band: int) -> tuple:
+    """
+    Finds a length of the longest common subsequence for near-identical sequences
+    with the Myers' O(N * D) algorithm: alignments are explored along the main diagonals
+    in the order of the number of unmatched tokens D, long runs of equal tokens
+    are skipped with slice comparisons
+    Only alignments which leave the diagonal by at most band beyond
+    the difference in lengths are explored
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :param band: a width of the band
+    :return: a length (a lower bound when not exact) and True if it is exact
+    """
+    rows, columns = len(first_tokens), len(second_tokens)
+    max_unmatched = abs(columns - rows) + 2 * band
+
+    # furthest[k] is the furthest position in the first sequence on the diagonal k = i - j
+    furthest = {1: 0}
+    for unmatched in range(max_unmatched + 1):
+        for diagonal in range(-unmatched, unmatched + 1, 2):
+            # a token of the second sequence or of the first one is left unmatched
+            row = max(furthest.get(diagonal + 1, -1),
+                      furthest.get(diagonal - 1, -2) + 1)
+            column = row - diagonal
+            if row < 0 or row > rows or column < 0 or column > columns:
+                continue
+            run = common_run_length(first_tokens, second_tokens, row, column)
+            furthest[diagonal] = row + run
+            if row + run == rows and column + run == columns:
+                return (rows + columns - unmatched) // 2, True
+
+    return common_run_length(first_tokens, second_tokens, 0, 0), False
+
+
+class CompactLcsMatrix(Sequence):
+    """
+    A longest common subsequence matrix stored in one flat typed buffer
+    (a NumPy array when NumPy is installed, array.array otherwise)
+    Element [i][j] is the lcs length of first_tokens[:i + 1] and second_tokens[:j + 1],
+    rows are zero-copy memoryviews, so matrix[i][j] indexing works as for nested lists
+    """
+
+    def __init__(self, rows: int=0, columns: int=0, buffer=None):
+        self.rows = rows
+        self.columns = columns
+        if buffer is None:
+            buffer = array('H', bytes(2 * rows * columns))
+        self.buffer = buffer
+        self._view = memoryview(buffer)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(self.rows))]
+        if row < 0:
+            row += self.rows
+        if not 0 <= row < self.rows:
+            raise IndexError('lcs matrix row out of range')
+        start = row * self.columns
+        return self._view[start:start + self.columns]
+
+    def tolist(self) -> list:
+        """
+        Converts the matrix into nested lists
+        :return: a list of rows
+        """
+        return [row.tolist() for row in self]
+
+
+def fill_compact_lcs_matrix(first_tokens, second_tokens) -> CompactLcsMatrix:
+    """
+    Fills a longest common subsequence matrix row by row:
+    each row is the prefix count of zero bits of the bit-parallel vector
+    over the second sequence, so no cell is computed by the interpreter
+    Cells are uint16 when the lcs length fits, uint32 otherwise
+    :param first_tokens: a sequence of tokens, one row per token
+    :param second_tokens: a sequence of tokens, one column per token
+    :return: a filled compact lcs matrix
+    """
+    rows, columns = len(first_tokens), len(second_tokens)
+    typecode = 'H' if min(rows, columns) < 1 << 16 else 'I'
+    if not rows or not columns:
+        return CompactLcsMatrix()
+
+    masks = build_match_masks(second_tokens)
+    full = (1 << columns) - 1
+    vector = full
+
+    if np is not None:
+        buffer = np.empty(rows * columns, dtype=np.dtype(typecode))
+    else:
+        buffer = array(typecode)
+
+    for row, token in enumerate(first_tokens):
+        match = masks.get(token)
+        if match:
+            common = vector & match
+            vector = ((vector + common) | (vector - common)) & full
+        zero_bits = format(vector, f'0{columns}b')[::-1].encode().translate(ZERO_BITS)
+        if np is not None:
+            np.cumsum(np.frombuffer(zero_bits, dtype=np.uint8),
+                      out=buffer[row * columns:(row + 1) * columns])
+        else:
+            buffer.extend(accumulate(zero_bits))
+
+    return CompactLcsMatrix(rows, columns, buffer)
+
+
+def lcs_prefix_lengths(first_tokens, second_tokens) -> list:
+    """
+    Finds lengths of the longest common subsequences
+    of every prefix of the first sequence with the whole second sequence
+    in O(n) memory
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :return: a list where element i is the lcs length of first_tokens[:i] and second_tokens
+    """
+    length = len(first_tokens)
+    vector = bit_parallel_lcs_vector(first_tokens, second_tokens)
+    bits = format(vector, f'0{length}b')[::-1] if length else ''
+    return list(accumulate(bits.encode().translate(ZERO_BITS), initial=0))
+
+
+def _small_lcs_pairs(first_tokens, second_tokens,
+                     first_offset: int, second_offset: int, pairs: list):
+    rows = len(first_tokens) + 1
+    columns = len(second_tokens) + 1
+    matrix = [[0] * columns for _ in range(rows)]
+    for i in range(1, rows):
+        word = first_tokens[i - 1]
+        previous, current = matrix[i - 1], matrix[i]
+        for j in range(1, columns):
+            if word == second_tokens[j - 1]:
+                current[j] = previous[j - 1] + 1
+            else:
+                current[j] = max(previous[j], current[j - 1])
+
+    block = []
+    i, j = rows - 1, columns - 1
+    while i and j:
+        if first_tokens[i - 1] == second_tokens[j - 1]:
+            block.append((first_offset + i - 1, second_offset + j - 1))
+            i -= 1
+            j -= 1
+        elif matrix[i - 1][j] >= matrix[i][j - 1]:
+            i -= 1
+        else:
+            j -= 1
+    pairs.extend(reversed(block))
+
+
+def _hirschberg(first_tokens, second_tokens,
+                first_offset: int, second_offset: int, pairs: list):
+    if not first_tokens or not second_tokens:
+        return
+    if len(second_tokens) == 1:
+        for i, token in enumerate(first_tokens):
+            if token == second_tokens[0]:
+                pairs.append((first_offset + i, second_offset))
+                break
+        return
+    if len(first_tokens) * len(second_tokens) <= SMALL_BLOCK_CELLS:
+        _small_lcs_pairs(first_tokens, second_tokens,
+                         first_offset, second_offset, pairs)
+        return
+
+    middle = len(second_tokens) // 2
+    forward = lcs_prefix_lengths(first_tokens, second_tokens[:middle])
+    backward = lcs_prefix_lengths(first_tokens[::-1], second_tokens[middle:][::-1])
+
+    length = len(first_tokens)
+    split = max(range(length + 1),
+                key=lambda i: forward[i] + backward[length - i])
+
+    _hirschberg(first_tokens[:split], second_tokens[:middle],
+                first_offset, second_offset, pairs)
+    _hirschberg(first_tokens[split:], second_tokens[middle:],
+                first_offset + split, second_offset + middle, pairs)
+
+
+def hirschberg_lcs(first_tokens, second_tokens) -> tuple:
+    """
+    Finds the longest common subsequence itself using the Hirschberg's algorithm:
+    the second sequence is halved, the best split of the first one is found
+    from the forward and backward lcs rows, and both halves are solved recursively
+    Only O(n + m) memory is used, the rows are computed bit-parallel
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :return: the longest common subsequence and a tuple of index pairs (i, j)
+    where first_tokens[i] == second_tokens[j] is a token of the subsequence
+    e.g. first_tokens = ('the', 'big', 'cat'), second_tokens = ('the', 'cat')
+    --> (('the', 'cat'), ((0, 0), (2, 1)))
+    """
+    pairs = []
+    _hirschberg(first_tokens, second_tokens, 0, 0, pairs)
+    lcs = tuple(first_tokens[i] for i, _ in pairs)
+    return lcs, tuple(pairs)
+
+
+def count_matches(first_tokens, second_tokens) -> int:
+    """
+    Counts matching pairs of positions (i, j) where first_tokens[i] == second_tokens[j]
+    in O(n + m), it is the cost of hunt_szymanski_lcs_length
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :return: a number of matching pairs
+    """
+    first_counts = Counter(first_tokens)
+    second_counts = Counter(second_tokens)
+    if len(first_counts) > len(second_counts):
+        first_counts, second_counts = second_counts, first_counts
+    return sum(count * second_counts[token]
+               for token, count in first_counts.items() if token in second_counts)
+
+
+def hunt_szymanski_lcs_length(first_tokens, second_tokens, min_length: int=0) -> int:
+    """
+    Finds a length of the longest common subsequence using the Hunt–Szymanski algorithm:
+    only matching pairs of positions are visited, each with a binary search,
+    so the cost is O((r + n) log n) for r matching pairs
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :param min_length: the computation stops when this length cannot be reached
+    :return: a length of the longest common subsequence,
+    or any smaller value when it is less than min_length
+    """
+    positions = defaultdict(list)
+    for j in range(len(second_tokens) - 1, -1, -1):
+        positions[second_tokens[j]].append(j)
+
+    # thresholds[k] is the smallest j that ends a common subsequence of length k + 1
+    thresholds = []
+    remaining = len(first_tokens)
+    for token in first_tokens:
+        if len(thresholds) + remaining < min_length:
+            break
+        remaining -= 1
+        # positions go in descending order, so a token is not matched twice
+        for j in positions.get(token, ()):
+            k = bisect_left(thresholds, j)
+            if k == len(thresholds):
+                thresholds.append(j)
+            else:
+                thresholds[k] = j
+    return len(thresholds)
+
+
+def auto_lcs_length(first_tokens, second_tokens, min_length: int=0) -> int:
+    """
+    Finds a length of the longest common subsequence with the cheaper engine:
+    hunt_szymanski_lcs_length for long sequences with few matching pairs,
+    bit_parallel_lcs_length otherwise
+    The choice uses count_matches and costs measured for both engines
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :param min_length: the computation stops when this length cannot be reached
+    :return: a length of the longest common subsequence,
+    or any smaller value when it is less than min_length
+    """
+    shorter, longer = sorted((len(first_tokens), len(second_tokens)))
+    if not shorter:
+        return 0
+    if longer <= SPARSE_MIN_LENGTH:
+        return bit_parallel_lcs_length(first_tokens, second_tokens, min_length)
+
+    bit_parallel_cost = shorter * (1 + longer / 64 * BIT_PARALLEL_WORD_COST)
+    sparse_cost = SPARSE_TOKEN_COST * (shorter + longer) + \
+                  SPARSE_MATCH_COST * count_matches(first_tokens, second_tokens)
+    if sparse_cost < bit_parallel_cost:
+        return hunt_szymanski_lcs_length(first_tokens, second_tokens, min_length)
+    return bit_parallel_lcs_length(first_tokens, second_tokens, min_length)
+
+
+class PackedSentenceBlock:
+    """
+    Short sentences packed into fixed-width fields of one big int,
+    so one bit-parallel pass over a suspicious sentence finds its lcs lengths
+    with all of them at once
+    A sentence is shorter than a field: the highest bit of each field stays zero
+    and stops the carry of the addition from spilling into the next sentence
+    """
+
+    def __init__(self, sentences, field_bits: int=FIELD_BITS):
+        if field_bits not in FIELD_TYPECODES:
+            raise ValueError(f'field_bits must be one of {tuple(FIELD_TYPECODES)}')
+        self.sentences = tuple(sentences)
+        self.field_bits = field_bits
+        self.masks = {}
+        self.keep = 0
+        for idx, sentence in enumerate(self.sentences):
+            if len(sentence) >= field_bits:
+                raise ValueError(f'a packed sentence must be shorter than {field_bits} tokens')
+            offset = idx * field_bits
+            self.keep |= ((1 << len(sentence)) - 1) << offset
+            for position, token in enumerate(sentence):
+                self.masks[token] = self.masks.get(token, 0) | 1 << (offset + position)
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def lcs_lengths(self, tokens) -> list:
+        """
+        Finds lcs lengths of the tokens with every sentence of the block
+        :param tokens: a sequence of tokens
+        :return: a list of lcs lengths in the order of the sentences
+        """
+        keep = self.keep
+        vector = keep
+        for token in tokens:
+            match = self.masks.get(token)
+            if match:
+                common = vector & match
+                vector = ((vector + common) | (vector - common)) & keep
+        fields = array(FIELD_TYPECODES[self.field_bits],
+                       (keep ^ vector).to_bytes(len(self) * self.field_bits // 8, 'little'))
+        if sys.byteorder == 'big':
+            fields.byteswap()
+        return list(map(int.bit_count, fields))
+
+    def find_matches(self, tokens, min_length: int) -> list:
+        """
+        Finds sentences of the block with an lcs length of at least min_length
+        :param tokens: a sequence of tokens
+        :param min_length: the smallest lcs length of interest
+        :return: a list of (sentence index in the block, lcs length)
+        """
+        if not any(token in self.masks for token in tokens):
+            return []
+        lengths = self.lcs_lengths(tokens)
+        return [(idx, lengths[idx])
+                for idx in compress(range(len(lengths)), map(min_length.__le__, lengths))]
+
+
+def pack_sentences(sentences, block_size: int) -> list:
+    """
+    Packs sentences shorter than FIELD_BITS tokens into blocks,
+    each sentence goes to the narrowest field it fits in
+    :param sentences: an iterable of sentences with tokens
+    :param block_size: a maximum number of sentences in a block
+    :return: a list of blocks
+    """
+    groups = {field_bits: [] for field_bits in FIELD_TYPECODES}
+    for sentence in sentences:
+        field_bits = min(bits for bits in FIELD_TYPECODES if len(sentence) < bits)
+        groups[field_bits].append(sentence)
+    return [PackedSentenceBlock(group[start:start + block_size], field_bits)
+            for field_bits, group in groups.items()
+            for start in range(0, len(group), block_size)]
+
+
+def common_suffix_length(first_tokens, second_tokens, first_end: int, second_end: int,
+                         limit: int) -> int:
+    """
+    Finds how many tokens coincide going back from the given positions,
+    as common_run_length does forward
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :param first_end: a position after the run in the first sequence
+    :param second_end: a position after the run in the second sequence
+    :param limit: a maximum length of the run
+    :return: a length of the common run
+    """
+    run = 0
+    step = 8
+    while True:
+        size = min(step, limit - run)
+        if size <= 0:
+            return run
+        if not runs_equal(first_tokens[first_end - run - size:first_end - run],
+                          second_tokens[second_end - run - size:second_end - run]):
+            break
+        run += size
+        step *= 2
+    while run < limit and \
+            first_tokens[first_end - run - 1] == second_tokens[second_end - run - 1]:
+        run += 1
+    return run
+
+
+def lcs_count_bound(first_tokens, second_tokens) -> int:
+    """
+    Finds an upper bound of the lcs length: the size of the multiset intersection
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :return: a number no less than the lcs length
+    """
+    return sum((Counter(first_tokens) & Counter(second_tokens)).values())
+
+
+def find_anchors(first_tokens, second_tokens, ngram: int=1) -> list:
+    """
+    Finds anchors as patience diff does: n-grams occurring exactly once in each sequence,
+    the longest chain of them in the same order in both sequences is kept,
+    overlapping n-grams on one diagonal are merged into one anchor
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :param ngram: a number of tokens in an n-gram
+    :return: a list of (first position, second position, length) of equal runs,
+    increasing and not overlapping in both sequences
+    e.g. first_tokens = ('a', 'x', 'b', 'c'), second_tokens = ('b', 'a', 'y', 'c')
+    --> [(0, 1, 1), (3, 3, 1)]
+    """
+    if ngram == 1:
+        first_keys, second_keys = first_tokens, second_tokens
+    else:
+        first_keys = list(zip(*(first_tokens[shift:] for shift in range(ngram))))
+        second_keys = list(zip(*(second_tokens[shift:] for shift in range(ngram))))
+    first_counts = Counter(first_keys)
+    second_counts = Counter(second_keys)
+    first_positions = {key: i for i, key in enumerate(first_keys) if first_counts[key] == 1}
+    candidates = [(first_positions[key], j) for j, key in enumerate(second_keys)
+                  if second_counts[key] == 1 and key in first_positions]
+
+    # the longest chain increasing in the first sequence, candidates go by the second one
+    tails = []
+    tail_indexes = []
+    previous = []
+    for idx, (i, _) in enumerate(candidates):
+        length = bisect_left(tails, i)
+        if length == len(tails):
+            tails.append(i)
+            tail_indexes.append(idx)
+        else:
+            tails[length] = i
+            tail_indexes[length] = idx
+        previous.append(tail_indexes[length - 1] if length else -1)
+    chain = []
+    idx = tail_indexes[-1] if tail_indexes else -1
+    while idx >= 0:
+        chain.append(candidates[idx])
+        idx = previous[idx]
+
+    anchors = []
+    for i, j in reversed(chain):
+        if anchors:
+            last_i, last_j, length = anchors[-1]
+            if i - last_i == j - last_j and i <= last_i + length:
+                anchors[-1] = (last_i, last_j, i + ngram - last_i)
+                continue
+            if i < last_i + length or j < last_j + length:
+                continue
+        anchors.append((i, j, ngram))
+    return anchors
+
+
+def split_lcs_problem(first_tokens, second_tokens) -> tuple:
+    """
+    Splits the lcs problem of two long sequences into independent sub-problems:
+    common prefixes and suffixes are matched, which keeps the lcs exact,
+    then the sequences are cut at anchors (see find_anchors), which makes the result
+    a lower bound, and parts between the anchors are split again
+    until they have fewer than ANCHOR_EXACT_CELLS cells or no anchors
+    Anchors covering less than ANCHOR_MIN_COVERAGE of a part are mostly chance matches,
+    such a part is left whole unless it has more than ANCHOR_MAX_EXACT_CELLS cells
+    :param first_tokens: a sequence of tokens
+    :param second_tokens: a sequence of tokens
+    :return: a number of matched tokens, a list of sub-problems
+    (first start, first end, second start, second end) and whether anchors were used;
+    the sum of the matched tokens and the lcs lengths of the sub-problems is
+    the lcs length when no anchors were used, and a lower bound of it otherwise
+    """
+    matched = 0
+    anchored = False
+    sub_problems = []
+    to_split = [(0, len(first_tokens), 0, len(second_tokens))]
+    while to_split:
+        first_start, first_end, second_start, second_end = to_split.pop()
+        run = common_run_length(first_tokens, second_tokens, first_start, second_start,
+                                min(first_end - first_start, second_end - second_start))
+        first_start += run
+        second_start += run
+        matched += run
+        run = common_suffix_length(first_tokens, second_tokens, first_end, second_end,
+                                   min(first_end - first_start, second_end - second_start))
+        first_end -= run
+        second_end -= run
+        matched += run
+        if first_start == first_end or second_start == second_end:
+            continue
+        cells = (first_end - first_start) * (second_end - second_start)
+        if cells <= ANCHOR_EXACT_CELLS:
+            sub_problems.append((first_start, first_end, second_start, second_end))
+            continue
+
+        shorter = min(first_end - first_start, second_end - second_start)
+        for ngram in ANCHOR_NGRAMS:
+            anchors = find_anchors(first_tokens[first_start:first_end],
+                                   second_tokens[second_start:second_end],
+                                   ngram)
+            if anchors and (cells > ANCHOR_MAX_EXACT_CELLS or
+                            sum(length for _, _, length in anchors) >=
+                            ANCHOR_MIN_COVERAGE * shorter):
+                break
+        else:
+            sub_problems.append((first_start, first_end, second_start, second_end))
+            continue
+
+        anchored = True
+        previous_first, previous_second = first_start, second_start
+        for i, j, length in anchors:
+            to_split.append((previous_first, first_start + i,
+                             previous_second, second_start + j))
+            matched += length
+            previous_first = first_start + i + length
+            previous_second = second_start + j + length
+        to_split.append((previous_first, first_end, previous_second, second_end))
+    return matched, sub_problems, anchored
@@ -2,15 +2,43 @@
 Longest common subsequence problem
 """
 
-import os
-import pickle
-import re
+import json
+from array import array
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import NamedTuple
 
+import instrumentation
 from decorators import input_checker
-from tokenizer import tokenize
+from instrumentation import PipelineStats, timed
+from lcs_engines import (FIELD_BITS, CompactLcsMatrix, auto_lcs_length,
+                         banded_lcs_length, fill_compact_lcs_matrix, hirschberg_lcs,
+                         lcs_count_bound, lcs_upper_bound, pack_sentences,
+                         split_lcs_problem)
+from pair_cache import SentencePairCache
+from tokenizer import encode_text, normalize, tokenize_lines
+from vocabulary import VocabularyStore, get_vocabulary
+
+# a number of characters read from a big file at once
+READ_CHUNK_SIZE = 1 << 20
+
+# a number of original sentences scored together by calculate_sentence_score_matrix
+PACKED_BLOCK_SENTENCES = 256
+
+# results of compare_sentences reused by the text-level functions, see SentencePairCache
+PAIR_CACHE = SentencePairCache()
+
+# output formats of iter_diff_report: a human readable text or JSON lines
+REPORT_FORMS = ('text', 'jsonl')
+
+# sentences accepted by the sentence-level functions: tuples of tokens
+# or memoryviews of ids taken from a token_corpus.TokenizedDocument
+SENTENCE_TYPES = (tuple, memoryview)
 
 
 @input_checker
+@timed('tokenization')
 def tokenize_by_lines(text: str) -> tuple:
     """
     Splits a text into sentences, sentences – into tokens,
@@ -20,9 +48,23 @@ def tokenize_by_lines(text: str) -> tuple:
     e.g. text = 'I have a cat.\nHis name is Bruno'
     --> (('i', 'have', 'a', 'cat'), ('his', 'name', 'is', 'bruno'))
     """
-    text = text.split('\n')
-    sent = (tokenize(sent) for sent in text)
-    return tuple(tokens for tokens in sent if tokens)
+    return tokenize_lines(text)
+
+
+@input_checker
+def encode_by_lines(text: str, vocabulary=None) -> tuple:
+    """
+    Tokenizes a text by lines as tokenize_by_lines does, but into ids,
+    the whole text is tokenized and interned in one pass (see tokenizer.encode_text)
+    The text-level scores and statistics accept the sentences as sentences of tokens,
+    a diff report needs tokens to print
+    :param text: the initial text
+    :param vocabulary: a TokenVocabulary or a VocabularyStore shared by texts which are compared
+    :return: a tuple of sentences with ids
+    e.g. text = 'I have a cat.\nHis cat' --> ((0, 1, 2, 3), (4, 3))
+    """
+    ids, ends = encode_text(text, vocabulary)
+    return tuple(tuple(ids[start:end]) for start, end in zip((0, *ends), ends))
 
 
 @input_checker
@@ -42,101 +84,417 @@ def create_zero_matrix(rows: int, columns: int) -> list:
 
 
 @input_checker
-def fill_lcs_matrix(first_sentence_tokens: tuple,
-                    second_sentence_tokens: tuple) -> list:
+@timed('dp_fill')
+def fill_lcs_matrix(first_sentence_tokens: SENTENCE_TYPES,
+                    second_sentence_tokens: SENTENCE_TYPES) -> list:
     """
     Fills a longest common subsequence matrix using the Needleman–Wunsch algorithm
-    :param first_sentence_tokens: a tuple of tokens
-    :param second_sentence_tokens: a tuple of tokens
+    :param first_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :param second_sentence_tokens: a tuple of tokens or a memoryview of ids
     :return: a lcs matrix
     """
     matrix = create_zero_matrix(len(first_sentence_tokens),
                                 len(second_sentence_tokens))
+    if (stats := instrumentation.ACTIVE.get()) is not None:
+        cells = len(first_sentence_tokens) * len(second_sentence_tokens)
+        stats.count('dp_cells', cells)
+        stats.peak('matrix_cells', cells)
 
     for i, word1 in enumerate(first_sentence_tokens):
         for j, word2 in enumerate(second_sentence_tokens):
             if word1 == word2:
-                matrix[i][j] = max(matrix[i - 1][j], matrix[i][j - 1]) + 1
+                matrix[i][j] = matrix[i - 1][j - 1] + 1 if i and j else 1
             else:
-                matrix[i][j] = max(matrix[i - 1][j], matrix[i][j - 1])
+                matrix[i][j] = max(matrix[i - 1][j] if i else 0,
+                                   matrix[i][j - 1] if j else 0)
     return matrix
 
 
 @input_checker
-def find_lcs_length(first_sentence_tokens: tuple,
-                    second_sentence_tokens: tuple,
-                    plagiarism_threshold: float) -> int:
+@timed('dp_fill')
+def fill_lcs_matrix_compact(first_sentence_tokens: SENTENCE_TYPES,
+                            second_sentence_tokens: SENTENCE_TYPES) -> CompactLcsMatrix:
+    """
+    Fills a longest common subsequence matrix with the same semantics as fill_lcs_matrix,
+    but stores it in a typed buffer (uint16/uint32) and fills it bit-parallel row by row
+    :param first_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :param second_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :return: a compact lcs matrix, it can be passed to find_lcs directly
+    """
+    if (stats := instrumentation.ACTIVE.get()) is not None:
+        cells = len(first_sentence_tokens) * len(second_sentence_tokens)
+        stats.count('dp_cells', cells)
+        stats.peak('matrix_cells', cells)
+    return fill_compact_lcs_matrix(first_sentence_tokens,
+                                   second_sentence_tokens)
+
+
+def min_lcs_length(plagiarism_threshold: float, suspicious_length: int) -> int:
+    """
+    Finds the smallest lcs length whose score is above the threshold
+    :param plagiarism_threshold: a threshold
+    :param suspicious_length: a number of tokens in a suspicious sentence
+    :return: the smallest length l such that l / suspicious_length > plagiarism_threshold
+    """
+    length = int(plagiarism_threshold * suspicious_length)
+    while length and (length - 1) / suspicious_length > plagiarism_threshold:
+        length -= 1
+    while length / suspicious_length <= plagiarism_threshold:
+        length += 1
+    return length
+
+
+@input_checker
+@timed('lcs_length')
+def find_lcs_length(first_sentence_tokens: SENTENCE_TYPES,
+                    second_sentence_tokens: SENTENCE_TYPES,
+                    plagiarism_threshold: float,
+                    *,
+                    band: int=None) -> int:
     """
-    Finds a length of the longest common subsequence using the Needleman–Wunsch algorithm
+    Finds a length of the longest common subsequence using the bit-parallel algorithm
+    or, for long sentences with few matching tokens, the Hunt–Szymanski one,
+    the matrix itself is not built
     When a length is less than the threshold, it becomes 0
-    :param first_sentence_tokens: a tuple of tokens
-    :param second_sentence_tokens: a tuple of tokens
+    The threshold is used to skip work: pairs whose length or multiset intersection
+    cannot reach it are rejected before the lcs computation,
+    and the computation stops as soon as the remaining tokens cannot lift the length over it
+    :param first_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :param second_sentence_tokens: a tuple of tokens or a memoryview of ids
     :param plagiarism_threshold: a threshold
+    :param band: for near-identical sentences, a width of the diagonal band
+    to try first, the full computation runs only if the banded result is not exact
     :return: a length of the longest common subsequence
     """
-    matrix = fill_lcs_matrix(first_sentence_tokens,
-                             second_sentence_tokens)
-    if matrix:
-        lcs_length = matrix[-1][-1]
-        if lcs_length / len(second_sentence_tokens) > plagiarism_threshold:
-            return lcs_length
+    needed = min_lcs_length(plagiarism_threshold, len(second_sentence_tokens))
+    if min(len(first_sentence_tokens), len(second_sentence_tokens)) < needed or \
+       plagiarism_threshold and \
+       lcs_upper_bound(first_sentence_tokens, second_sentence_tokens) < needed:
+        if (stats := instrumentation.ACTIVE.get()) is not None:
+            stats.count('pairs_pruned')
+        return 0
+
+    if (stats := instrumentation.ACTIVE.get()) is not None:
+        stats.count('pairs_scored')
+        stats.count('dp_cells', len(first_sentence_tokens) * len(second_sentence_tokens))
+    exact = False
+    if band is not None:
+        lcs_length, exact = banded_lcs_length(first_sentence_tokens,
+                                              second_sentence_tokens,
+                                              band)
+    if not exact:
+        lcs_length = auto_lcs_length(first_sentence_tokens,
+                                     second_sentence_tokens,
+                                     needed)
+    if lcs_length / len(second_sentence_tokens) > plagiarism_threshold:
+        return lcs_length
     return 0
 
 
 @input_checker
-def find_lcs(first_sentence_tokens: tuple,
-             second_sentence_tokens: tuple,
-             lcs_matrix: list) -> tuple:
+@timed('traceback')
+def find_lcs(first_sentence_tokens: SENTENCE_TYPES,
+             second_sentence_tokens: SENTENCE_TYPES,
+             lcs_matrix: Sequence) -> tuple:
     """
     Finds the longest common subsequence itself using the Needleman–Wunsch algorithm
-    :param first_sentence_tokens: a tuple of tokens
-    :param second_sentence_tokens: a tuple of tokens
-    :param lcs_matrix: a filled lcs matrix
+    :param first_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :param second_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :param lcs_matrix: a filled lcs matrix, a list of lists or a compact one
     :return: the longest common subsequence
     """
-    if len(first_sentence_tokens) != len(lcs_matrix) or \
-       len(second_sentence_tokens) != len(lcs_matrix[0]) or \
-       lcs_matrix[0][0] not in (0, 1):
+    if not is_lcs_matrix_of(first_sentence_tokens, second_sentence_tokens, lcs_matrix):
         return ()
+    return tuple(first_sentence_tokens[row]
+                 for row, _ in trace_lcs_pairs(first_sentence_tokens,
+                                               second_sentence_tokens,
+                                               lcs_matrix))
+
+
+def is_lcs_matrix_of(first_sentence_tokens: tuple,
+                     second_sentence_tokens: tuple,
+                     lcs_matrix: Sequence) -> bool:
+    """
+    Checks whether a matrix has the shape of an lcs matrix of two sentences
+    """
+    return len(first_sentence_tokens) == len(lcs_matrix) and \
+           len(second_sentence_tokens) == len(lcs_matrix[0]) and \
+           lcs_matrix[0][0] in (0, 1)
+
 
+def trace_lcs_pairs(first_sentence_tokens: tuple,
+                    second_sentence_tokens: tuple,
+                    lcs_matrix: Sequence) -> list:
+    """
+    Walks a filled lcs matrix back from the last cell
+    :param first_sentence_tokens: a tuple of tokens
+    :param second_sentence_tokens: a tuple of tokens
+    :param lcs_matrix: a filled lcs matrix of the sentences
+    :return: a list of (i, j) such that first_sentence_tokens[i] == second_sentence_tokens[j]
+    for each token of the lcs, in increasing order
+    """
     row = len(first_sentence_tokens) - 1
     column = len(second_sentence_tokens) - 1
 
-    longest_lcs = []
+    pairs = []
 
-    while row or column:
+    while row >= 0 and column >= 0:
         if first_sentence_tokens[row] == second_sentence_tokens[column]:
-            longest_lcs.append(first_sentence_tokens[row])
+            pairs.append((row, column))
             row -= 1
             column -= 1
-        elif lcs_matrix[row - 1][column] > lcs_matrix[row][column - 1] or not column:
+        elif row and (not column or
+                      lcs_matrix[row - 1][column] > lcs_matrix[row][column - 1]):
             row -= 1
-        else:
+        elif column:
             column -= 1
-    if first_sentence_tokens[0] == second_sentence_tokens[0]:
-        longest_lcs.append(first_sentence_tokens[0])
-    return tuple(longest_lcs[::-1])
+        else:
+            break
+    return pairs[::-1]
+
+
+@input_checker
+@timed('traceback')
+def find_lcs_alignment(first_sentence_tokens: SENTENCE_TYPES,
+                       second_sentence_tokens: SENTENCE_TYPES,
+                       lcs_matrix: Sequence) -> tuple:
+    """
+    Finds where the tokens of the longest common subsequence are in both sentences
+    and which parts of the sentences are left out of it, with one walk over the matrix
+    :param first_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :param second_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :param lcs_matrix: a filled lcs matrix, a list of lists or a compact one
+    :return: index pairs of the lcs tokens and the difference indexes of the sentences
+    as find_diff_in_sentence returns them
+    e.g. first_sentence_tokens = ('the', 'big', 'cat'), second_sentence_tokens = ('the', 'cat')
+    --> (((0, 0), (2, 1)), ((1, 2), ()))
+    """
+    if not is_lcs_matrix_of(first_sentence_tokens, second_sentence_tokens, lcs_matrix):
+        return ()
+    pairs = tuple(trace_lcs_pairs(first_sentence_tokens,
+                                  second_sentence_tokens,
+                                  lcs_matrix))
+    return pairs, (find_unmatched_spans((row for row, _ in pairs),
+                                        len(first_sentence_tokens)),
+                   find_unmatched_spans((column for _, column in pairs),
+                                        len(second_sentence_tokens)))
+
+def is_trusted_pair(original_sentence_tokens, suspicious_sentence_tokens) -> bool:
+    """
+    Checks whether a pair of sentences taken from already validated texts
+    can skip input_checker: both are non-empty tuples of tokens
+    :param original_sentence_tokens: a sentence of the validated original text
+    :param suspicious_sentence_tokens: a sentence of the validated suspicious text
+    :return: True if the undecorated functions can be called on the pair
+    """
+    return isinstance(original_sentence_tokens, tuple) and \
+           isinstance(suspicious_sentence_tokens, tuple) and \
+           bool(original_sentence_tokens) and bool(suspicious_sentence_tokens)
+
+
+def is_sentence_pair(original_sentence_tokens, suspicious_sentence_tokens) -> bool:
+    """
+    Checks whether a pair of sentences can go to the lcs engines without input_checker:
+    a trusted pair or a pair with memoryviews of ids of a TokenizedDocument,
+    which hold numbers only; unlike a trusted pair, it is not hashed for the pair cache
+    :param original_sentence_tokens: a sentence of the original text
+    :param suspicious_sentence_tokens: a sentence of the suspicious text
+    :return: True if both sentences are non-empty tuples or memoryviews
+    """
+    return isinstance(original_sentence_tokens, SENTENCE_TYPES) and \
+           isinstance(suspicious_sentence_tokens, SENTENCE_TYPES) and \
+           bool(original_sentence_tokens) and bool(suspicious_sentence_tokens)
+
 
 @input_checker
 def calculate_plagiarism_score(lcs_length: int,
-                               suspicious_sentence_tokens: tuple
+                               suspicious_sentence_tokens: SENTENCE_TYPES
                                )-> float:
     """
     Calculates the plagiarism score
     The score is the lcs length divided by the number of tokens in a suspicious sentence
     :param lcs_length: a length of the longest common subsequence
-    :param suspicious_sentence_tokens: a tuple of tokens
+    :param suspicious_sentence_tokens: a tuple of tokens, strings or ids of encode_by_lines,
+    or a memoryview of ids
     :return: a score from 0 to 1, where 0 means no plagiarism, 1 – the texts are the same
     """
     if lcs_length > len(suspicious_sentence_tokens) or \
-       not all(isinstance(elem, str) for elem in suspicious_sentence_tokens):
+       not all(isinstance(elem, (str, int)) for elem in suspicious_sentence_tokens):
         return -1
     return lcs_length / len(suspicious_sentence_tokens)
 
+def score_sentence_pair(original_sentence_tokens: tuple,
+                        suspicious_sentence_tokens: tuple,
+                        plagiarism_threshold: float) -> float:
+    """
+    Calculates the plagiarism score of one pair of sentences from validated texts,
+    a length below the threshold gives 0
+    :param original_sentence_tokens: a tuple of tokens
+    :param suspicious_sentence_tokens: a tuple of tokens
+    :param plagiarism_threshold: a threshold
+    :return: a score from 0 to 1 or -1 for a non-valid pair
+    """
+    if is_trusted_pair(original_sentence_tokens, suspicious_sentence_tokens):
+        lcs_length = find_lcs_length.unchecked(original_sentence_tokens,
+                                               suspicious_sentence_tokens,
+                                               plagiarism_threshold)
+        return calculate_plagiarism_score.unchecked(lcs_length,
+                                                    suspicious_sentence_tokens)
+    lcs_length = find_lcs_length(original_sentence_tokens,
+                                 suspicious_sentence_tokens,
+                                 plagiarism_threshold)
+    return calculate_plagiarism_score(lcs_length,
+                                      suspicious_sentence_tokens)
+
+
+def map_sentence_pairs(func, *iterables, workers: int=1, chunk_size: int=64,
+                       pool: ProcessPoolExecutor=None) -> list:
+    """
+    Applies func to sentence pairs, serially or on a process pool
+    Pairs are sent to the workers in chunks, results are merged in the input order
+    :param func: a module-level function, so that it can be pickled
+    :param iterables: iterables of arguments for func
+    :param workers: a number of processes, 1 runs in the current process, None uses all cores
+    :param chunk_size: a number of pairs sent to a worker at once
+    :param pool: a pool kept by the caller across calls, it is used instead of a new one
+    :return: a list of results
+    """
+    if pool is not None:
+        return list(pool.map(func, *iterables, chunksize=chunk_size))
+    if workers == 1:
+        return list(map(func, *iterables))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, *iterables, chunksize=chunk_size))
+
+
 @input_checker
+@timed('sentence_matrix')
+def calculate_sentence_score_matrix(original_text_tokens: tuple,
+                                    suspicious_text_tokens: tuple,
+                                    plagiarism_threshold: float=0.0) -> list:
+    """
+    Scores every suspicious sentence against every original sentence
+    Identical sentences are scored once, tokens are encoded into ids
+    Original sentences shorter than FIELD_BITS tokens are packed into blocks
+    of PACKED_BLOCK_SENTENCES (see pack_sentences), and one bit-parallel pass
+    over a suspicious sentence scores it against a whole block;
+    longer ones are scored pair by pair
+    :param original_text_tokens: a tuple of sentences with tokens
+    :param suspicious_text_tokens: a tuple of sentences with tokens
+    :param plagiarism_threshold: pairs with a score not above it are left out
+    :return: a sparse matrix, a list with a dictionary original index -> score
+    for each suspicious sentence
+    e.g. original_text_tokens = (('the', 'cat'), ('a', 'dog')),
+         suspicious_text_tokens = (('a', 'dog'), ('the', 'cat', 'sleeps'))
+    --> [{1: 1.0}, {0: 0.6666666666666666}]
+    """
+    token_ids = {}
+
+    def encode(sentence):
+        return tuple(token_ids.setdefault(token, len(token_ids)) for token in sentence)
+
+    unique_originals = {}
+    for orig_idx, sentence in enumerate(original_text_tokens):
+        if isinstance(sentence, tuple) and sentence:
+            unique_originals.setdefault(encode(sentence), []).append(orig_idx)
+    short = [sentence for sentence in unique_originals if len(sentence) < FIELD_BITS]
+    long = [sentence for sentence in unique_originals if len(sentence) >= FIELD_BITS]
+    blocks = pack_sentences(short, PACKED_BLOCK_SENTENCES)
+
+    unique_scores = {}
+    matrix = []
+    for sentence in suspicious_text_tokens:
+        if not isinstance(sentence, tuple) or not sentence:
+            matrix.append({})
+            continue
+        sentence = encode(sentence)
+        if sentence not in unique_scores:
+            needed = min_lcs_length(plagiarism_threshold, len(sentence))
+            scores = {}
+            for block in blocks:
+                for idx, length in block.find_matches(sentence, needed):
+                    scores[block.sentences[idx]] = length / len(sentence)
+            for original in long:
+                if lcs_upper_bound(original, sentence) >= needed:
+                    length = auto_lcs_length(original, sentence, needed)
+                    if length >= needed:
+                        scores[original] = length / len(sentence)
+            unique_scores[sentence] = scores
+
+        matrix.append({orig_idx: score
+                       for original, score in unique_scores[sentence].items()
+                       for orig_idx in unique_originals[original]})
+    return matrix
+
+
+@timed('alignment')
+def align_sentences(score_matrix: list, method: str='greedy') -> list:
+    """
+    Matches suspicious sentences with original ones, each original sentence is used once
+    'greedy' takes the pairs with the highest scores first,
+    'monotone' keeps the order of sentences and maximizes the sum of scores
+    :param score_matrix: a sparse matrix from calculate_sentence_score_matrix
+    :param method: 'greedy' or 'monotone'
+    :return: a list with an original index or None for each suspicious sentence
+    """
+    alignment = [None] * len(score_matrix)
+
+    if method == 'greedy':
+        pairs = sorted(((score, susp_idx, orig_idx)
+                        for susp_idx, row in enumerate(score_matrix)
+                        for orig_idx, score in row.items()),
+                       key=lambda pair: -pair[0])
+        used = set()
+        for _, susp_idx, orig_idx in pairs:
+            if alignment[susp_idx] is None and orig_idx not in used:
+                alignment[susp_idx] = orig_idx
+                used.add(orig_idx)
+        return alignment
+
+    if method == 'monotone':
+        # Fenwick trees of prefix maxima over original indexes:
+        # the best sum of scores and the last pair of the chain giving it
+        size = max((max(row) for row in score_matrix if row), default=-1) + 1
+        sums = [0.0] * (size + 1)
+        ends = [None] * (size + 1)
+        chains = []
+        for susp_idx, row in enumerate(score_matrix):
+            updates = []
+            for orig_idx, score in row.items():
+                best, end, position = 0.0, None, orig_idx
+                while position:
+                    if sums[position] > best:
+                        best, end = sums[position], ends[position]
+                    position &= position - 1
+                chains.append((susp_idx, orig_idx, end))
+                updates.append((orig_idx + 1, best + score, len(chains) - 1))
+            for position, total, end in updates:
+                while position <= size:
+                    if total > sums[position]:
+                        sums[position], ends[position] = total, end
+                    position += position & -position
+
+        last = ends[max(range(size + 1), key=sums.__getitem__)] if size else None
+        while last is not None:
+            susp_idx, orig_idx, last = chains[last]
+            alignment[susp_idx] = orig_idx
+        return alignment
+
+    raise ValueError(f'unknown alignment method {method!r}')
+
+
+@input_checker
+@timed('text_score')
 def calculate_text_plagiarism_score(original_text_tokens: tuple,
                                     suspicious_text_tokens: tuple,
-                                    plagiarism_threshold: float=0.3) -> float:
+                                    plagiarism_threshold: float=0.3,
+                                    *,
+                                    workers: int=1,
+                                    chunk_size: int=64,
+                                    alignment: str=None,
+                                    stats: PipelineStats=None,
+                                    cache: SentencePairCache=None) -> float:
     """
     Calculates the plagiarism score: compares two texts line by line using lcs
     The score is the sum of lcs values for each pair divided by the number of tokens in suspicious text
@@ -144,23 +502,54 @@ def calculate_text_plagiarism_score(original_text_tokens: tuple,
     :param original_text_tokens: a tuple of sentences with tokens
     :param suspicious_text_tokens: a tuple of sentences with tokens
     :param plagiarism_threshold: a threshold
-    :return: a score from 0 to 1, where 0 means no plagiarism, 1 – the texts are the same
+    :param workers: a number of processes scoring the pairs, 1 means no process pool
+    :param chunk_size: a number of pairs sent to a process at once
+    :param alignment: None compares sentence i with sentence i, 'greedy' or 'monotone'
+    compares every pair of sentences and pairs them with align_sentences
+    :param stats: if given, timers and counters of the call are collected into it
+    :param cache: pairs found in it, e.g. ones added by accumulate_diff_stats,
+    are not computed again, nothing is added to it, PAIR_CACHE by default
+    :return: a score from 0 to 1, where 0 means no plagiarism, 1 – the texts are the same
     """
-    while len(original_text_tokens) < len(suspicious_text_tokens):
-        original_text_tokens += ('',)
+    if stats is not None:
+        with instrumentation.collecting(stats):
+            return calculate_text_plagiarism_score.unchecked(original_text_tokens,
+                                                             suspicious_text_tokens,
+                                                             plagiarism_threshold,
+                                                             workers=workers,
+                                                             chunk_size=chunk_size,
+                                                             alignment=alignment,
+                                                             cache=cache)
 
-    scores = []
-    for susp_sent, orig_sent in zip(suspicious_text_tokens,
-                                    original_text_tokens):
-        lcs_length = find_lcs_length(orig_sent,
-                                     susp_sent,
-                                     plagiarism_threshold)
-        score = calculate_plagiarism_score(lcs_length,
-                                           susp_sent)
-        if score >= 0:
-            scores.append(score)
+    if alignment is not None:
+        matrix = calculate_sentence_score_matrix(original_text_tokens,
+                                                 suspicious_text_tokens,
+                                                 plagiarism_threshold)
+        aligned = align_sentences(matrix, alignment)
+        return sum(matrix[susp_idx][orig_idx]
+                   for susp_idx, orig_idx in enumerate(aligned)
+                   if orig_idx is not None) / len(suspicious_text_tokens)
+
+    original_text_tokens += ('',) * (len(suspicious_text_tokens) -
+                                     len(original_text_tokens))
 
-    text_score = sum(scores) / len(suspicious_text_tokens)
+    cached = cached_sentence_pairs(original_text_tokens,
+                                   suspicious_text_tokens,
+                                   PAIR_CACHE if cache is None else cache)
+    missing = [idx for idx, pair in enumerate(cached) if pair is None]
+    computed = iter(map_sentence_pairs(score_sentence_pair,
+                                       [original_text_tokens[idx] for idx in missing],
+                                       [suspicious_text_tokens[idx] for idx in missing],
+                                       repeat(plagiarism_threshold),
+                                       workers=workers,
+                                       chunk_size=chunk_size))
+    # a pair below the threshold scores 0, as in find_lcs_length
+    scores = [next(computed) if pair is None else
+              pair.score if pair.score > plagiarism_threshold or pair.score < 0 else 0.0
+              for pair in cached]
+
+    text_score = sum(score for score in scores if score >= 0) / \
+                 len(suspicious_text_tokens)
 
     return text_score
 
@@ -192,47 +581,174 @@ def find_diff(tokens: tuple,
     return tuple(indexes)
 
 
+def find_unmatched_spans(matched_indexes, length: int) -> tuple:
+    """
+    Finds the parts of a sequence between its matched positions
+    :param matched_indexes: increasing positions of matched tokens
+    :param length: a length of the sequence
+    :return: a flat tuple of start and end indexes of unmatched parts
+    e.g. matched_indexes = (0, 3), length = 5 --> (1, 3, 4, 5)
+    """
+    spans = []
+    start = 0
+    for idx in matched_indexes:
+        if idx > start:
+            spans.extend((start, idx))
+        start = idx + 1
+    if length > start:
+        spans.extend((start, length))
+    return tuple(spans)
+
+
+def locate_lcs(original_sentence_tokens: tuple,
+               suspicious_sentence_tokens: tuple,
+               lcs: tuple) -> list:
+    """
+    Finds the leftmost positions of the lcs tokens in both sentences
+    :return: a list of index pairs or None if lcs is not a subsequence of both
+    """
+    pairs = []
+    row = column = 0
+    try:
+        for token in lcs:
+            row = original_sentence_tokens.index(token, row)
+            column = suspicious_sentence_tokens.index(token, column)
+            pairs.append((row, column))
+            row += 1
+            column += 1
+    except ValueError:
+        return None
+    return pairs
+
+
+@timed('diff')
 def find_diff_in_sentence(original_sentence_tokens: tuple,
                           suspicious_sentence_tokens: tuple,
-                          lcs: tuple) -> tuple:
+                          lcs: tuple,
+                          pairs: tuple=None) -> tuple:
     """
     Finds words not present in lcs.
+    The spans come straight from the index pairs of the lcs tokens,
+    e.g. from find_lcs_alignment or hirschberg_lcs, so repeated tokens are placed
+    where the lcs computation matched them; without pairs the lcs is located
+    in the sentences leftmost
     :param original_sentence_tokens: a tuple of tokens
     :param suspicious_sentence_tokens: a tuple of tokens
     :param lcs: a longest common subsequence
+    :param pairs: index pairs of the lcs tokens in both sentences
     :return: a tuple with tuples of indexes
     """
-    if isinstance(lcs, tuple) and not lcs:
-        if not original_sentence_tokens:
-            return ((), (0, len(suspicious_sentence_tokens)))
-        return ((0, len(original_sentence_tokens)),
-                (0, len(suspicious_sentence_tokens)))
+    if pairs is None:
+        if not isinstance(lcs, tuple) or \
+           (pairs := locate_lcs(original_sentence_tokens,
+                                suspicious_sentence_tokens,
+                                lcs)) is None:
+            return ()
 
-    if original_sentence_tokens == suspicious_sentence_tokens\
-    and original_sentence_tokens == lcs:
-        return ((), ())
+    return (find_unmatched_spans((row for row, _ in pairs),
+                                 len(original_sentence_tokens)),
+            find_unmatched_spans((column for _, column in pairs),
+                                 len(suspicious_sentence_tokens)))
 
-    if not (origin_indexes := find_diff(original_sentence_tokens,
-                                        suspicious_sentence_tokens,
-                                        lcs)):
-        return origin_indexes
-    if not (susp_indexes := find_diff(suspicious_sentence_tokens,
-                                      original_sentence_tokens,
-                                      lcs)):
-        return susp_indexes
 
-    return origin_indexes, susp_indexes
+class SentencePairStats(NamedTuple):
+    """
+    Results of one lcs computation for a pair of sentences
+    """
+    lcs_length: int
+    lcs: tuple
+    score: float
+    difference_indexes: tuple
+
+
+@timed('sentence_pair')
+def compare_sentences(original_sentence_tokens: tuple,
+                      suspicious_sentence_tokens: tuple) -> SentencePairStats:
+    """
+    Runs the lcs computation for a pair of sentences once
+    and derives the lcs length, the lcs itself, the plagiarism score and the diff from it
+    :param original_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :param suspicious_sentence_tokens: a tuple of tokens or a memoryview of ids
+    :return: statistics for the pair of sentences
+    e.g. original_sentence_tokens = ('the', 'big', 'cat'),
+         suspicious_sentence_tokens = ('the', 'cat', 'sleeps')
+    --> SentencePairStats(lcs_length=2, lcs=('the', 'cat'), score=0.6666666666666666,
+                          difference_indexes=((1, 2), (2, 3)))
+    """
+    if is_sentence_pair(original_sentence_tokens, suspicious_sentence_tokens):
+        if (stats := instrumentation.ACTIVE.get()) is not None:
+            stats.count('pairs_scored')
+            stats.count('dp_cells', len(original_sentence_tokens) *
+                                    len(suspicious_sentence_tokens))
+        lcs, pairs = hirschberg_lcs(original_sentence_tokens,
+                                    suspicious_sentence_tokens)
+        lcs_length = len(lcs)
+        score = calculate_plagiarism_score.unchecked(lcs_length,
+                                                     suspicious_sentence_tokens)
+    else:
+        lcs = pairs = ()
+        lcs_length = find_lcs_length(original_sentence_tokens,
+                                     suspicious_sentence_tokens,
+                                     0.0)
+        score = calculate_plagiarism_score(lcs_length,
+                                           suspicious_sentence_tokens)
+
+    difference_indexes = find_diff_in_sentence(original_sentence_tokens,
+                                               suspicious_sentence_tokens,
+                                               lcs,
+                                               pairs)
+    return SentencePairStats(lcs_length, lcs, score, difference_indexes)
+
+
+def cached_sentence_pairs(original_text_tokens: tuple,
+                          suspicious_text_tokens: tuple,
+                          cache: SentencePairCache) -> list:
+    """
+    Looks up pairs of sentences with the same index in a cache of compare_sentences results,
+    an empty cache is not consulted, so the pairs are not hashed
+    :param original_text_tokens: a tuple of sentences with tokens
+    :param suspicious_text_tokens: a tuple of sentences with tokens
+    :param cache: a cache of SentencePairStats
+    :return: a list with SentencePairStats or None for each pair which is not cached
+    """
+    if not cache:
+        pairs = [None] * min(len(original_text_tokens), len(suspicious_text_tokens))
+    else:
+        pairs = [cache.get(original, suspicious)
+                 if is_trusted_pair(original, suspicious) else None
+                 for original, suspicious in zip(original_text_tokens, suspicious_text_tokens)]
+    if (stats := instrumentation.ACTIVE.get()) is not None:
+        hits = len(pairs) - pairs.count(None)
+        stats.count('cache_hits', hits)
+        stats.count('cache_misses', len(pairs) - hits)
+    return pairs
 
 
 @input_checker
+@timed('diff_stats')
 def accumulate_diff_stats(original_text_tokens: tuple,
                           suspicious_text_tokens: tuple,
-                          plagiarism_threshold: float=0.3) -> dict:
+                          plagiarism_threshold: float=0.3,
+                          *,
+                          workers: int=1,
+                          chunk_size: int=64,
+                          alignment: str=None,
+                          stats: PipelineStats=None,
+                          cache: SentencePairCache=None) -> dict:
     """
     Accumulates the main statistics for pairs of sentences in texts:
             lcs_length, plagiarism_score and indexes of differences
+    Each pair of sentences is computed once, the text score is derived from the same results
     :param original_text_tokens: a tuple of sentences with tokens
     :param suspicious_text_tokens: a tuple of sentences with tokens
+    :param workers: a number of processes computing the pairs, 1 means no process pool
+    :param chunk_size: a number of pairs sent to a process at once
+    :param alignment: None compares sentence i with sentence i, 'greedy' or 'monotone'
+    pairs each suspicious sentence with the best original one,
+    the pairs are stored under 'aligned_original_indexes'
+    :param stats: if given, timers and counters of the call are collected into it
+    :param cache: pairs found in it are not computed again, computed pairs are added to it,
+    PAIR_CACHE by default
     :return: a dictionary of main statistics for each pair of sentences
     including average text plagiarism, sentence plagiarism for each sentence and lcs lengths for each sentence
     {'text_plagiarism': int,
@@ -240,54 +756,184 @@ def accumulate_diff_stats(original_text_tokens: tuple,
      'sentence_lcs_length': list,
      'difference_indexes': list}
     """
+    if stats is not None:
+        with instrumentation.collecting(stats):
+            return accumulate_diff_stats.unchecked(original_text_tokens,
+                                                   suspicious_text_tokens,
+                                                   plagiarism_threshold,
+                                                   workers=workers,
+                                                   chunk_size=chunk_size,
+                                                   alignment=alignment,
+                                                   cache=cache)
+
     length = len(suspicious_text_tokens)
-    while len(original_text_tokens) < length:
-        original_text_tokens += ('',)
+    aligned = None
+    if alignment is not None:
+        aligned = align_sentences(calculate_sentence_score_matrix(original_text_tokens,
+                                                                  suspicious_text_tokens,
+                                                                  plagiarism_threshold),
+                                  alignment)
+        original_text_tokens = tuple(original_text_tokens[orig_idx]
+                                     if orig_idx is not None else ''
+                                     for orig_idx in aligned)
+    original_text_tokens += ('',) * (length - len(original_text_tokens))
 
-    stat =  {'text_plagiarism': 0,
-            'sentence_plagiarism': [0] * length,
-            'sentence_lcs_length': [0] * length,
-            'difference_indexes': [0] * length}
+    cache = PAIR_CACHE if cache is None else cache
+    pairs = cached_sentence_pairs(original_text_tokens, suspicious_text_tokens, cache)
+    missing = [idx for idx, pair in enumerate(pairs) if pair is None]
+    computed = map_sentence_pairs(compare_sentences,
+                                  [original_text_tokens[idx] for idx in missing],
+                                  [suspicious_text_tokens[idx] for idx in missing],
+                                  workers=workers,
+                                  chunk_size=chunk_size)
+    for idx, pair in zip(missing, computed):
+        pairs[idx] = pair
+        if is_trusted_pair(original_text_tokens[idx], suspicious_text_tokens[idx]):
+            cache.put(original_text_tokens[idx], suspicious_text_tokens[idx], pair)
 
-    stat['text_plagiarism'] = calculate_text_plagiarism_score(
-                                  original_text_tokens,
-                                  suspicious_text_tokens,
-                                  plagiarism_threshold)
-
-    for i in range(length):
-        lcs_length = find_lcs_length(original_text_tokens[i],
-                                     suspicious_text_tokens[i],
-                                     plagiarism_threshold=0.0)
-        stat['sentence_plagiarism'][i] = calculate_plagiarism_score(
-                                             lcs_length,
-                                             suspicious_text_tokens[i])
-
-        stat['sentence_lcs_length'][i] = lcs_length
-
-        lcs_matrix = fill_lcs_matrix(original_text_tokens[i],
-                                     suspicious_text_tokens[i])
-        lcs = find_lcs(original_text_tokens[i],
-                       suspicious_text_tokens[i],
-                       lcs_matrix)
-        stat['difference_indexes'][i] = find_diff_in_sentence(
-                                            original_text_tokens[i],
-                                            suspicious_text_tokens[i],
-                                            lcs)
+    # a pair below the threshold counts as 0, as in find_lcs_length
+    scores = [pair.score for pair in pairs if pair.score > plagiarism_threshold]
+
+    stat =  {'text_plagiarism': sum(scores) / length,
+            'sentence_plagiarism': [pair.score for pair in pairs],
+            'sentence_lcs_length': [pair.lcs_length for pair in pairs],
+            'difference_indexes': [pair.difference_indexes for pair in pairs]}
+    if aligned is not None:
+        stat['aligned_original_indexes'] = aligned
     return stat
 
 
 def sentence_report(sentence: tuple, indexes:tuple) -> str:
     start = end = 0
-    report = ''
+    parts = []
     for i in indexes:
         end = i
-        report += ' '.join(sentence[start:end] + ('| ',))
+        parts.append(' '.join(sentence[start:end] + ('| ',)))
         start = i
-    report += ' '.join(sentence[end:])
-    return report
+    parts.append(' '.join(sentence[end:]))
+    return ''.join(parts)
+
+
+def iter_report_pairs(original_text_tokens: tuple,
+                      suspicious_text_tokens: tuple,
+                      accumulated_diff_stats: dict=None,
+                      cache: SentencePairCache=None):
+    """
+    Yields pairs of sentences for a report one by one
+    :param original_text_tokens: a tuple of sentences with tokens
+    :param suspicious_text_tokens: a tuple of sentences with tokens
+    :param accumulated_diff_stats: statistics made by accumulate_diff_stats,
+    if None, sentence i is compared with sentence i when it is reached
+    :param cache: a cache of compared pairs, PAIR_CACHE by default
+    :return: a generator of (suspicious index, original index or None, SentencePairStats)
+    """
+    if accumulated_diff_stats is not None:
+        aligned = accumulated_diff_stats.get('aligned_original_indexes',
+                                             range(len(original_text_tokens)))
+        for idx, difference_indexes in enumerate(accumulated_diff_stats['difference_indexes']):
+            yield idx, aligned[idx] if idx < len(aligned) else None, \
+                  SentencePairStats(accumulated_diff_stats['sentence_lcs_length'][idx],
+                                    (),
+                                    accumulated_diff_stats['sentence_plagiarism'][idx],
+                                    difference_indexes)
+        return
+
+    cache = PAIR_CACHE if cache is None else cache
+    for idx, suspicious in enumerate(suspicious_text_tokens):
+        orig_idx = idx if idx < len(original_text_tokens) else None
+        original = original_text_tokens[idx] if orig_idx is not None else ''
+        trusted = is_trusted_pair(original, suspicious)
+        # an empty cache is not consulted, as in cached_sentence_pairs
+        pair = cache.get(original, suspicious) if trusted and cache else None
+        if pair is None:
+            pair = compare_sentences(original, suspicious)
+            if trusted:
+                cache.put(original, suspicious, pair)
+        yield idx, orig_idx, pair
+
+
+def iter_diff_report(original_text_tokens: tuple,
+                     suspicious_text_tokens: tuple,
+                     accumulated_diff_stats: dict=None,
+                     *,
+                     plagiarism_threshold: float=0.3,
+                     form: str='text',
+                     cache: SentencePairCache=None):
+    """
+    Yields a diff report pair by pair, so it can be sent on before the texts are compared
+    to the end, and neither the report nor the statistics are kept in memory
+    :param original_text_tokens: a tuple of sentences with tokens
+    :param suspicious_text_tokens: a tuple of sentences with tokens
+    :param accumulated_diff_stats: statistics made by accumulate_diff_stats,
+    if None, the pairs are compared while the report is produced
+    :param plagiarism_threshold: a threshold of the text score when the pairs are compared here
+    :param form: 'text' gives the report of create_diff_report,
+    'jsonl' gives a JSON object for each pair and one with the text score at the end
+    :param cache: a cache of compared pairs, PAIR_CACHE by default
+    :return: a generator of report chunks
+    e.g. form='jsonl'
+    --> {"sentence": 0, "original_sentence": 0, "lcs_length": 2, "score": 0.66...,
+         "difference_indexes": [[1, 2], [2, 3]]}
+        {"text_plagiarism": 0.66...}
+    """
+    if form not in REPORT_FORMS:
+        raise ValueError(f'unknown report form {form!r}')
+
+    total = 0.0
+    for idx, orig_idx, pair in iter_report_pairs(original_text_tokens,
+                                                 suspicious_text_tokens,
+                                                 accumulated_diff_stats,
+                                                 cache):
+        if pair.score > plagiarism_threshold:
+            total += pair.score
+        if form == 'jsonl':
+            yield json.dumps({'sentence': idx,
+                              'original_sentence': orig_idx,
+                              'lcs_length': pair.lcs_length,
+                              'score': pair.score,
+                              'difference_indexes': pair.difference_indexes}) + '\n'
+            continue
+        orig_diff, susp_diff = pair.difference_indexes
+        original_sentence = original_text_tokens[orig_idx] if orig_idx is not None else ()
+        orig = sentence_report(original_sentence, orig_diff)
+        susp = sentence_report(suspicious_text_tokens[idx], susp_diff)
+        yield f'- {orig}\n+ {susp}\n\n' \
+              f'lcs = {pair.lcs_length}, plagiarism = {pair.score * 100}%\n\n'
+
+    if accumulated_diff_stats is not None:
+        text_score = accumulated_diff_stats['text_plagiarism']
+    else:
+        # an empty suspicious text scores 0, as in calculate_text_plagiarism_score
+        text_score = total / len(suspicious_text_tokens) if suspicious_text_tokens else 0.0
+    if form == 'jsonl':
+        yield json.dumps({'text_plagiarism': text_score}) + '\n'
+    else:
+        yield f'Text average plagiarism (words): {text_score * 100}%'
+
+
+@timed('report')
+def write_diff_report(file,
+                      original_text_tokens: tuple,
+                      suspicious_text_tokens: tuple,
+                      accumulated_diff_stats: dict=None,
+                      **kwargs) -> None:
+    """
+    Writes a diff report to a file-like object as it is produced, see iter_diff_report
+    :param file: an object with a write method, e.g. an open text file or sys.stdout
+    :param original_text_tokens: a tuple of sentences with tokens
+    :param suspicious_text_tokens: a tuple of sentences with tokens
+    :param accumulated_diff_stats: statistics made by accumulate_diff_stats or None
+    :param kwargs: plagiarism_threshold, form and cache of iter_diff_report
+    """
+    for chunk in iter_diff_report(original_text_tokens,
+                                  suspicious_text_tokens,
+                                  accumulated_diff_stats,
+                                  **kwargs):
+        file.write(chunk)
 
 
 @input_checker
+@timed('report')
 def create_diff_report(original_text_tokens: tuple,
                        suspicious_text_tokens: tuple,
                        accumulated_diff_stats: dict) -> str:
@@ -298,71 +944,168 @@ def create_diff_report(original_text_tokens: tuple,
     :param accumulated_diff_stats: a dictionary with statistics for each pair of sentences
     :return: a report
     """
-    report = ''
-    for idx, (orig_idx, susp_idx) in enumerate(
-      accumulated_diff_stats['difference_indexes']):
-        orig = sentence_report(original_text_tokens[idx], orig_idx)
-        susp = sentence_report(suspicious_text_tokens[idx], susp_idx)
-        lcs = accumulated_diff_stats['sentence_lcs_length'][idx]
-        score = accumulated_diff_stats['sentence_plagiarism'][idx] * 100
-        report += f'- {orig}\n+ {susp}\n\nlcs = {lcs}, plagiarism = {score}%\n\n'
-    text_score = accumulated_diff_stats['text_plagiarism'] * 100
-    report += f'Text average plagiarism (words): {text_score}%'
-    return report
+    return ''.join(iter_diff_report(original_text_tokens,
+                                    suspicious_text_tokens,
+                                    accumulated_diff_stats))
 
 
+@timed('lcs_length')
 def find_lcs_length_optimized(first_sentence_tokens: list,
                               second_sentence_tokens: list,
                               plagiarism_threshold: float) -> int:
     """
-    Finds a length of the longest common subsequence using the Hirschberg's algorithm
-    At the same time, if the first and last tokens coincide,
-    they are immediately added to lcs and not analyzed
+    Finds a length of the longest common subsequence using the bit-parallel algorithm:
+    positions of the longer sequence are packed into a big int,
+    so each token of the shorter one is processed with a few word-parallel operations
+    When the sequences have few matching tokens, the Hunt–Szymanski algorithm
+    visits only the matching pairs instead
+    Works with tokens, ids produced by tokenize_big_file and ids of a TokenizedDocument
     :param first_sentence_tokens: a list of tokens
     :param second_sentence_tokens: a list of tokens
     :return: a length of the longest common subsequence
     """
-    length = min(len(first_sentence_tokens), len(second_sentence_tokens))
-    x_curr_vector = [0] * (length + 1)
+    if not first_sentence_tokens or not second_sentence_tokens:
+        return 0
 
-    for x_word in first_sentence_tokens[:length]:
-        x_prev_vector = x_curr_vector[:]
-        if x_word not in second_sentence_tokens[:length]:
-            continue
-        for i, y_word in enumerate(second_sentence_tokens[:length]):
-            if x_word == y_word:
-                x_curr_vector[i + 1] = x_prev_vector[i] + 1
-            else:
-                x_curr_vector[i + 1] = max(x_curr_vector[i], x_prev_vector[i + 1])
-
-    lcs_length = x_curr_vector[-1]
+    if (stats := instrumentation.ACTIVE.get()) is not None:
+        stats.count('dp_cells', len(first_sentence_tokens) * len(second_sentence_tokens))
+    lcs_length = auto_lcs_length(first_sentence_tokens,
+                                 second_sentence_tokens)
     if lcs_length / len(second_sentence_tokens) > plagiarism_threshold:
         return lcs_length
     return 0
 
-def tokenize_big_file(path_to_file: str) -> tuple:
+
+@timed('lcs_length')
+def find_lcs_length_anchored(first_sentence_tokens: list,
+                             second_sentence_tokens: list,
+                             plagiarism_threshold: float,
+                             *,
+                             workers: int=1,
+                             chunk_size: int=16) -> tuple:
+    """
+    Finds a length of the longest common subsequence of whole documents
+    in the style of patience diff: the documents are cut at tokens or n-grams
+    found once in each of them (see split_lcs_problem),
+    and the parts between them are solved exactly with auto_lcs_length, in parallel
+    Cutting at anchors may miss a longer subsequence, so the length is exact
+    only when no anchors were needed or it reaches the multiset upper bound
+    Works with tokens, ids produced by tokenize_big_file and ids of a TokenizedDocument
+    :param first_sentence_tokens: a sequence of tokens
+    :param second_sentence_tokens: a sequence of tokens
+    :param plagiarism_threshold: a threshold
+    :param workers: a number of processes solving the parts, 1 means no process pool
+    :param chunk_size: a number of parts sent to a process at once
+    :return: a length of the longest common subsequence, or its lower bound,
+    and True if the length is exact
+    """
+    if not first_sentence_tokens or not second_sentence_tokens:
+        return 0, True
+
+    matched, sub_problems, anchored = split_lcs_problem(first_sentence_tokens,
+                                                        second_sentence_tokens)
+    if (stats := instrumentation.ACTIVE.get()) is not None:
+        stats.count('anchored_sub_problems', len(sub_problems))
+        stats.count('dp_cells', sum((first_end - first_start) * (second_end - second_start)
+                                    for first_start, first_end, second_start, second_end
+                                    in sub_problems))
+    first_parts = [first_sentence_tokens[first_start:first_end]
+                   for first_start, first_end, _, _ in sub_problems]
+    second_parts = [second_sentence_tokens[second_start:second_end]
+                    for _, _, second_start, second_end in sub_problems]
+    if workers != 1:
+        # slices of a memory-mapped document cannot be sent to other processes
+        first_parts = [part.tolist() if isinstance(part, memoryview) else part
+                       for part in first_parts]
+        second_parts = [part.tolist() if isinstance(part, memoryview) else part
+                        for part in second_parts]
+    lcs_length = matched + sum(map_sentence_pairs(auto_lcs_length,
+                                                  first_parts,
+                                                  second_parts,
+                                                  workers=workers,
+                                                  chunk_size=chunk_size))
+    exact = not anchored or \
+            lcs_length == lcs_count_bound(first_sentence_tokens, second_sentence_tokens)
+    if lcs_length / len(second_sentence_tokens) > plagiarism_threshold:
+        return lcs_length, exact
+    return 0, exact
+
+
+@timed('traceback')
+def find_lcs_optimized(first_sentence_tokens: list,
+                       second_sentence_tokens: list) -> tuple:
+    """
+    Finds the longest common subsequence itself using the Hirschberg's algorithm
+    in linear memory, so the lcs matrix is never built
+    :param first_sentence_tokens: a list of tokens
+    :param second_sentence_tokens: a list of tokens
+    :return: the longest common subsequence and index pairs of its tokens in both sequences
+    e.g. first_sentence_tokens = ('the', 'big', 'cat'), second_sentence_tokens = ('the', 'cat')
+    --> (('the', 'cat'), ((0, 0), (2, 1)))
+    """
+    if not isinstance(first_sentence_tokens, Sequence) or \
+       not isinstance(second_sentence_tokens, Sequence):
+        return (), ()
+
+    return hirschberg_lcs(first_sentence_tokens, second_sentence_tokens)
+
+
+def iter_big_file_ids(path_to_file: str,
+                      start: int=0,
+                      stop: int=None,
+                      chunk_size: int=READ_CHUNK_SIZE,
+                      vocabulary: VocabularyStore=None):
+    """
+    Reads a big file in chunks and yields ids of its tokens one by one,
+    so the memory does not depend on the size of the file
+    Only tokens in the window [start, stop) are yielded and added to the vocabulary,
+    reading ends as soon as the window is passed
+    :param path_to_file: a path
+    :param start: a position of the first token to yield
+    :param stop: a position after the last token to yield, None means the end of the file
+    :param chunk_size: a number of characters read at once
+    :param vocabulary: a vocabulary store, the default one is vocabulary.txt in the working directory
+    :return: a generator of ids
+    """
+    if vocabulary is None:
+        vocabulary = get_vocabulary()
+
+    def window(tokens, position):
+        first = max(start - position, 0)
+        last = len(tokens) if stop is None else min(stop - position, len(tokens))
+        if first < last:
+            yield from vocabulary.ids(tokens[first:last])
+
+    with open(path_to_file, encoding='utf-8') as file:
+        position = 0
+        tail = ''
+        while (chunk := file.read(chunk_size)) and \
+              (stop is None or position < stop):
+            text = tail + normalize(chunk)
+            tokens = text.split()
+            # the last word may continue in the next chunk
+            tail = tokens.pop() if tokens and not text[-1].isspace() else ''
+            yield from window(tokens, position)
+            position += len(tokens)
+        yield from window(tail.split(), position)
+
+
+@timed('tokenization')
+def tokenize_big_file(path_to_file: str,
+                      start: int=0,
+                      stop: int=None,
+                      compact: bool=False,
+                      vocabulary: VocabularyStore=None) -> tuple:
     """
     Reads, tokenizes and transforms a big file into a numeric form
     :param path_to_file: a path
+    :param start: a position of the first token to take
+    :param stop: a position after the last token to take, None means the end of the file
+    :param compact: if True, ids are stored in array('I') instead of a tuple of ints
+    :param vocabulary: a vocabulary store shared by files which are compared
     :return: a tuple with ids
     """
-    file = open(path_to_file, encoding='utf-8')
-
-    def generate_indexes(file):
-        if os.path.exists('vocabulary.pickle'):
-            with open('vocabulary.pickle', 'rb') as vocab:
-                vocabulary = pickle.load(vocab)
-        else:
-            vocabulary = {'_i': 0}
-
-        for line in file:
-            tokens = re.sub('[^a-z \n]', '', line.lower()).split()
-            for token in tokens:
-                if token not in vocabulary:
-                    vocabulary[token] = vocabulary['_i']
-                    vocabulary['_i'] += 1
-                yield vocabulary[token]
-        with open('vocabulary.pickle', 'wb') as outfile:
-            pickle.dump(vocabulary, outfile)
-            file.close()
-    return tuple(generate_indexes(file))
+    ids = iter_big_file_ids(path_to_file, start, stop, vocabulary=vocabulary)
+    if compact:
+        return array('I', ids)
+    return tuple(ids)
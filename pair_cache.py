@@ -0,0 +1,96 @@
+"""
+A content-addressed cache of sentence pair results for lab_2
+"""
+
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+# a number of sentence pairs kept by the default cache
+DEFAULT_CACHE_SIZE = 100_000
+
+
+def pair_key(original_sentence_tokens: tuple, suspicious_sentence_tokens: tuple) -> bytes:
+    """
+    Hashes the contents of a pair of sentences, tokens may be strings or ids
+    :param original_sentence_tokens: a tuple of tokens
+    :param suspicious_sentence_tokens: a tuple of tokens
+    :return: a 16-byte digest
+    """
+    content = repr((original_sentence_tokens, suspicious_sentence_tokens)).encode('utf-8')
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+class SentencePairCache:
+    """
+    Keeps results for pairs of sentences, e.g. SentencePairStats,
+    so a resubmitted text costs only its edited sentences
+    The least recently used pair is evicted when max_size pairs are stored,
+    max_size 0 turns the cache off
+    The cache is kept on disk with save and load
+    """
+
+    def __init__(self, max_size: int=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, original_sentence_tokens: tuple, suspicious_sentence_tokens: tuple):
+        """
+        :param original_sentence_tokens: a tuple of tokens
+        :param suspicious_sentence_tokens: a tuple of tokens
+        :return: the stored result or None
+        """
+        key = pair_key(original_sentence_tokens, suspicious_sentence_tokens)
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._results.move_to_end(key)
+        return result
+
+    def put(self, original_sentence_tokens: tuple, suspicious_sentence_tokens: tuple,
+            result) -> None:
+        """
+        Stores a result, evicting the least recently used ones over max_size
+        :param original_sentence_tokens: a tuple of tokens
+        :param suspicious_sentence_tokens: a tuple of tokens
+        :param result: a result for the pair, not None
+        """
+        if not self.max_size:
+            return
+        key = pair_key(original_sentence_tokens, suspicious_sentence_tokens)
+        self._results[key] = result
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self.hits = self.misses = 0
+
+    def save(self, path: str) -> None:
+        """
+        Writes the cache to disk, a reader never sees a partly written file
+        :param path: a path of the cache file
+        """
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path: str) -> 'SentencePairCache':
+        """
+        Reads a cache written with save
+        :param path: a path of the cache file
+        :return: the cache
+        """
+        with open(path, 'rb') as file:
+            return pickle.load(file)
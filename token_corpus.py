@@ -0,0 +1,156 @@
+"""
+A binary format of tokenized documents for lab_2, opened with mmap without copying
+
+A file consists of:
+    a header: magic, version, byte order, a number of tokens, a number of sentences,
+              a number of ids in the vocabulary and a length of its path
+    the vocabulary path in utf-8, padded to 8 bytes
+    ids of the tokens, uint32
+    padding to 8 bytes
+    end positions of the sentences in the ids, uint64
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from tokenizer import encode_text
+from vocabulary import VocabularyStore, get_vocabulary
+
+MAGIC = b'LCSTOK\x00\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sHHQQQQ')
+BYTE_ORDERS = {'little': 1, 'big': 2}
+
+# a number of lines tokenized at once by write_tokenized_file
+WRITE_CHUNK_LINES = 1 << 16
+
+
+def _padding(size: int) -> int:
+    return -size % 8
+
+
+def _write_header(file, token_count: int, sentence_count: int,
+                  vocabulary_size: int, vocabulary_path: bytes) -> None:
+    file.seek(0)
+    file.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDERS[sys.byteorder], token_count,
+                           sentence_count, vocabulary_size, len(vocabulary_path)))
+    file.write(vocabulary_path + b'\0' * _padding(len(vocabulary_path)))
+
+
+def write_tokenized_file(source_path: str,
+                         target_path: str,
+                         vocabulary: VocabularyStore=None) -> None:
+    """
+    Tokenizes a text file as tokenize_by_lines does and writes its ids in the binary format,
+    the text is read WRITE_CHUNK_LINES lines at a time
+    :param source_path: a path of the text
+    :param target_path: a path of the binary document
+    :param vocabulary: a vocabulary store, the default one is vocabulary.txt in the working directory
+    """
+    if vocabulary is None:
+        vocabulary = get_vocabulary()
+    vocabulary_path = os.fsencode(vocabulary.path)
+    header_size = HEADER.size + len(vocabulary_path) + _padding(len(vocabulary_path))
+
+    ends = array('Q')
+    token_count = 0
+    with open(source_path, encoding='utf-8') as source, open(target_path, 'wb') as target:
+        target.write(b'\0' * header_size)
+        lines = []
+        for line in source:
+            lines.append(line)
+            if len(lines) == WRITE_CHUNK_LINES:
+                ids, chunk_ends = encode_text(''.join(lines), vocabulary)
+                ids.tofile(target)
+                ends.extend(token_count + end for end in chunk_ends)
+                token_count += len(ids)
+                lines = []
+        ids, chunk_ends = encode_text(''.join(lines), vocabulary)
+        ids.tofile(target)
+        ends.extend(token_count + end for end in chunk_ends)
+        token_count += len(ids)
+
+        target.write(b'\0' * _padding(4 * token_count))
+        ends.tofile(target)
+        _write_header(target, token_count, len(ends), len(vocabulary), vocabulary_path)
+
+
+class TokenizedDocument:
+    """
+    A document written with write_tokenized_file, mapped into memory
+    ids is a memoryview of all token ids, a sentence is a slice of it,
+    so nothing is copied and processes opening the same file share its pages
+    The lcs engines and find_lcs_length_optimized, find_lcs_length_anchored,
+    find_lcs_optimized of main accept ids directly, the sentence-level functions of main
+    (find_lcs_length, find_lcs, calculate_plagiarism_score...) accept sentences directly;
+    the text-level ones hash and pad tuples of sentences, they take sentences()
+    A document is pickled as its path and mapped again when unpickled
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, byte_order, token_count, sentence_count,
+         self.vocabulary_size, path_length) = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a tokenized document')
+        if byte_order != BYTE_ORDERS[sys.byteorder]:
+            raise ValueError(f'{path} was written on a machine with another byte order')
+        self.vocabulary_path = os.fsdecode(self._map[HEADER.size:HEADER.size + path_length])
+
+        start = HEADER.size + path_length + _padding(path_length)
+        self._buffer = memoryview(self._map)
+        self.ids = self._buffer[start:start + 4 * token_count].cast('I')
+        start += 4 * token_count + _padding(4 * token_count)
+        self.ends = self._buffer[start:start + 8 * sentence_count].cast('Q')
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, idx: int) -> memoryview:
+        return self.ids[self.ends[idx - 1] if idx else 0:self.ends[idx]]
+
+    def __iter__(self):
+        start = 0
+        for end in self.ends:
+            yield self.ids[start:end]
+            start = end
+
+    def __reduce__(self):
+        return TokenizedDocument, (self.path,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def sentences(self) -> tuple:
+        """
+        Copies the sentences for the text-level functions of main,
+        e.g. calculate_text_plagiarism_score and accumulate_diff_stats
+        :return: a tuple of sentences with ids
+        """
+        return tuple(tuple(sentence) for sentence in self)
+
+    def vocabulary(self) -> VocabularyStore:
+        """
+        :return: the store the ids refer to
+        """
+        vocabulary = VocabularyStore(self.vocabulary_path)
+        if len(vocabulary) < self.vocabulary_size:
+            raise ValueError(f'{self.vocabulary_path} has fewer ids than {self.path} uses')
+        return vocabulary
+
+    def close(self) -> None:
+        """
+        Unmaps the file, ids and sentences taken from the document must be released first
+        """
+        self.ids.release()
+        self.ends.release()
+        self._buffer.release()
+        self._map.close()
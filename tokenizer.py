@@ -3,6 +3,20 @@ Tokenizer out of lab_1 for usage in lab_2
 """
 
 import string
+from array import array
+from itertools import accumulate, compress
+
+# deletes punctuation, built once for all calls
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
+
+def normalize(text: str) -> str:
+    """
+    Converts a text into lowercase and removes punctuation, line breaks are kept
+    :param text: the initial text
+    :return: the normalized text
+    """
+    return text.lower().translate(PUNCTUATION_TABLE)
 
 
 def tokenize(text: str) -> tuple:
@@ -13,5 +27,59 @@ def tokenize(text: str) -> tuple:
     e.g. text = 'The weather is sunny, the man is happy.'
     --> ['the', 'weather', 'is', 'sunny', 'the', 'man', 'is', 'happy']
     """
-    table = text.maketrans({word: None for word in string.punctuation})
-    return tuple(text.translate(table).split())
+    return tuple(normalize(text).split())
+
+
+def tokenize_lines(text: str) -> tuple:
+    """
+    Tokenizes every line of a text as tokenize does, the text is normalized once
+    :param text: the initial text
+    :return: a tuple of non-empty lines with tokens
+    e.g. text = 'I have a cat.\nHis name is Bruno'
+    --> (('i', 'have', 'a', 'cat'), ('his', 'name', 'is', 'bruno'))
+    """
+    return tuple(filter(None, map(tuple, map(str.split, normalize(text).split('\n')))))
+
+
+class TokenVocabulary:
+    """
+    Interns tokens into ids in memory, ids are given in the order tokens first appear
+    It has the interface of vocabulary.VocabularyStore, which keeps ids on disk
+    """
+
+    def __init__(self):
+        self._ids = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, token):
+        return token in self._ids
+
+    def ids(self, tokens) -> list:
+        """
+        Converts tokens into ids, new tokens get new ids
+        :param tokens: a sequence of tokens
+        :return: a list of ids
+        """
+        ids = self._ids
+        for token in dict.fromkeys(tokens):
+            ids.setdefault(token, len(ids))
+        return list(map(ids.__getitem__, tokens))
+
+
+def encode_text(text: str, vocabulary=None) -> tuple:
+    """
+    Tokenizes a whole text into ids in one pass, lines become sentences
+    :param text: the initial text
+    :param vocabulary: a TokenVocabulary or a VocabularyStore shared by texts which are compared
+    :return: ids of all tokens in array('I') and the end positions of non-empty lines in it,
+    sentence i is ids[ends[i - 1]:ends[i]] (ids[:ends[0]] for the first one)
+    e.g. text = 'a cat\n\nthe cat' --> (array('I', [0, 1, 2, 1]), array('I', [2, 4]))
+    """
+    if vocabulary is None:
+        vocabulary = TokenVocabulary()
+    normalized = normalize(text)
+    counts = list(map(len, map(str.split, normalized.split('\n'))))
+    ends = compress(accumulate(counts), counts)
+    return array('I', vocabulary.ids(normalized.split())), array('I', ends)
@@ -0,0 +1,102 @@
+"""
+A persistent vocabulary of token ids for lab_2
+"""
+
+import os
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_VOCABULARY_PATH = 'vocabulary.txt'
+
+
+class VocabularyStore:
+    """
+    Maps tokens to ids using an append-only log: line i of the file is the token with id i
+    New tokens are appended under an exclusive file lock, after reading
+    the lines other processes appended, so concurrent processes agree on ids
+    The file is read lazily, on the first lookup
+    Without fcntl (e.g. on Windows) appends are not locked
+    """
+
+    def __init__(self, path: str=DEFAULT_VOCABULARY_PATH):
+        self.path = path
+        self._ids = None
+        self._count = 0
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._load())
+
+    def __contains__(self, token):
+        return token in self._load()
+
+    def _catch_up(self, file):
+        file.seek(self._offset)
+        data = file.read()
+        # a line without a line break is still being written by another process
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            self._ids.setdefault(line.decode('utf-8'), self._count)
+            self._count += 1
+        self._offset += end
+
+    def _load(self) -> dict:
+        if self._ids is None:
+            self._ids = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as file:
+                    self._catch_up(file)
+        return self._ids
+
+    def add(self, tokens) -> None:
+        """
+        Appends tokens missing in the vocabulary to the log
+        :param tokens: an iterable of tokens without whitespace
+        """
+        ids = self._load()
+        with open(self.path, 'ab+') as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                self._catch_up(file)
+                new_tokens = [token for token in dict.fromkeys(tokens) if token not in ids]
+                data = ''.join(f'{token}\n' for token in new_tokens).encode('utf-8')
+                file.write(data)
+                file.flush()
+                for token in new_tokens:
+                    ids[token] = self._count
+                    self._count += 1
+                self._offset += len(data)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+    def ids(self, tokens) -> list:
+        """
+        Converts tokens into ids, new tokens are added with one append
+        :param tokens: a sequence of tokens without whitespace
+        :return: a list of ids
+        """
+        ids = self._load()
+        if any(token not in ids for token in tokens):
+            self.add(tokens)
+        return [ids[token] for token in tokens]
+
+
+@lru_cache(maxsize=None)
+def _shared_vocabulary(path: str) -> VocabularyStore:
+    return VocabularyStore(path)
+
+
+def get_vocabulary(path: str=DEFAULT_VOCABULARY_PATH) -> VocabularyStore:
+    """
+    Gives one store per file in a process, so the log is read once, not on every call;
+    lines appended by other processes are read on the next append
+    :param path: a path of the vocabulary file
+    :return: the store of the file
+    """
+    return _shared_vocabulary(os.path.abspath(path))